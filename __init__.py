@@ -2,8 +2,13 @@ __version__ = "0.0.1"
 
 from .layers import *
 from .internal import payloadClass
+from . import instrumentation
 
 def parse(data):
+	if not isinstance(data, bytes): ## memoryview or bytearray, decoded values must not hold on to the caller's buffer
+		data = bytes(data)
+	if instrumentation.collector is not None:
+		instrumentation.collector.record_packet(len(data))
 	payload = payloadClass(data)
 	root = hazilLayer(False)
 	root.parse(payload)
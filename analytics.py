@@ -0,0 +1,322 @@
+import math
+from collections import namedtuple, OrderedDict
+from typing import Union, Any, Dict
+
+# Incremental windowed analytics over GameEngine events
+#
+# A StreamAnalytics subscribes to the engine's event bus and turns callbacks into metric samples at engine.time:
+#
+#	kills			1 per Murder, counted for the game and the killer
+#	meetings		1 per StartMeeting, counted for the game and the player who called it
+#	meetingInterval		seconds since the previous StartMeeting of the game
+#	killToReport		seconds from a Murder to the meeting reporting that body
+#	distance		map units moved per PlayerMovement
+#	ventEntries		1 per vent entered
+#	ventTime		seconds spent in the vent, sampled on exit
+#
+# Every metric of a scope (the game, or one player of it) feeds a set of windows. A tumbling window keeps count, sum,
+# min and max of the current interval and the last closed one. A sliding window keeps count and sum over a ring of
+# buckets, expired buckets are subtracted as time moves on. Both cost O(1) per sample and answer queries without
+# looking at past events. Only the most recent games are kept.
+
+WindowResult = namedtuple('WindowResult', ['start', 'end', 'count', 'total', 'min', 'max'])
+
+DEFAULT_WINDOWS = {
+    'minute': ('tumbling', 60),
+    'last5m': ('sliding', 300, 30),
+}
+MAX_GAMES = 64
+
+
+class TumblingWindow:
+    def __init__(self, width):
+        self.width = width
+        self.start: Union[bool, Any] = None
+        self.count: int = 0
+        self.total: float = 0.0
+        self.min: Union[bool, Any] = None
+        self.max: Union[bool, Any] = None
+        self.closed: Union[bool, WindowResult] = None  # Last complete interval
+
+    def advance(self, ts):
+        start = (ts // self.width) * self.width
+        if self.start is None:
+            self.start = start
+            return
+        if start <= self.start:
+            return
+        if start == self.start + self.width:
+            self.closed = self._result()
+        else:  # Nothing was seen in the interval right before this one
+            self.closed = WindowResult(start - self.width, start, 0, 0.0, None, None)
+        self.start = start
+        self.count = 0
+        self.total = 0.0
+        self.min = self.max = None
+
+    def add(self, ts, value):
+        self.advance(ts)  # Late samples are counted in the current interval
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+
+    def _result(self):
+        return WindowResult(self.start, self.start + self.width, self.count, self.total, self.min, self.max)
+
+    def result(self, now=None, closed=False):  # Current interval so far, or the last complete one
+        if now is not None:
+            self.advance(now)
+        if closed:
+            return self.closed
+        return self._result() if self.start is not None else None
+
+
+class SlidingWindow:
+    def __init__(self, width, buckets=12):
+        self.width = width
+        self.buckets: int = buckets
+        self.bucketWidth = width / buckets
+        self.counts = [0] * buckets
+        self.sums = [0.0] * buckets
+        self.head: Union[bool, Any] = None  # Absolute number of the newest bucket
+        self.count: int = 0
+        self.total: float = 0.0
+
+    def advance(self, ts):
+        bucket = int(ts // self.bucketWidth)
+        if self.head is None:
+            self.head = bucket
+            return
+        if bucket <= self.head:
+            return
+        steps = min(bucket - self.head, self.buckets)
+        for step in range(1, steps + 1):  # Expire the buckets the window slid past
+            slot = (self.head + step) % self.buckets
+            self.count -= self.counts[slot]
+            self.total -= self.sums[slot]
+            self.counts[slot] = 0
+            self.sums[slot] = 0.0
+        if steps == self.buckets:
+            self.total = 0.0  # Everything expired, drop any float drift
+        self.head = bucket
+
+    def add(self, ts, value):
+        self.advance(ts)
+        bucket = int(ts // self.bucketWidth)
+        if bucket <= self.head - self.buckets:
+            return  # Older than the whole window
+        slot = min(bucket, self.head) % self.buckets
+        self.counts[slot] += 1
+        self.sums[slot] += value
+        self.count += 1
+        self.total += value
+
+    def result(self, now=None, closed=False):
+        if now is not None:
+            self.advance(now)
+        if self.head is None:
+            return None
+        end = (self.head + 1) * self.bucketWidth
+        return WindowResult(end - self.width, end, self.count, self.total, None, None)
+
+
+def make_window(spec):  # ('tumbling', width) or ('sliding', width, buckets)
+    kind = spec[0]
+    if kind == 'tumbling':
+        return TumblingWindow(*spec[1:])
+    if kind == 'sliding':
+        return SlidingWindow(*spec[1:])
+    raise ValueError("Unknown window kind %r" % (kind,))
+
+
+class Scope:  # Windows of every metric seen for the game or for one player
+    def __init__(self, windows):
+        self.windowSpecs = windows
+        self.metrics: Dict[str, Dict[str, Any]] = {}  # metric -> window name -> window
+        self.totals: Dict[str, list] = {}  # metric -> [count, total] since the game started
+
+    def add(self, metric, ts, value):
+        windows = self.metrics.get(metric)
+        if windows is None:
+            windows = self.metrics[metric] = {name: make_window(spec) for name, spec in self.windowSpecs.items()}
+            self.totals[metric] = [0, 0.0]
+        for window in windows.values():
+            window.add(ts, value)
+        totals = self.totals[metric]
+        totals[0] += 1
+        totals[1] += value
+
+    def result(self, metric, window, now=None, closed=False):
+        windows = self.metrics.get(metric)
+        if windows is None:
+            return None
+        return windows[window].result(now, closed)
+
+    def snapshot(self, now=None):  # Plain dict of every window result, for dashboards
+        return {metric: {'count': self.totals[metric][0], 'total': self.totals[metric][1],
+                         'windows': {name: window.result(now) for name, window in windows.items()}}
+                for metric, windows in self.metrics.items()}
+
+
+class GameAnalytics:
+    def __init__(self, game_id, windows):
+        self.gameId = game_id
+        self.windows = windows
+        self.game: Scope = Scope(windows)
+        self.players: Dict[Any, Scope] = {}  # Player id -> Scope
+        self.lastSeen: Any = 0
+
+        self.lastMeetingAt: Union[bool, Any] = False
+        self.killedAt: Dict[Any, Any] = {}  # Victim player id -> time of the kill, until the body is reported
+        self.ventedAt: Dict[Any, Any] = {}  # Player id -> time the player entered a vent
+        self.positions: Dict[Any, Any] = {}  # Player id -> last (x, y) seen in a movement update
+
+    def player(self, player_id):
+        scope = self.players.get(player_id)
+        if scope is None:
+            scope = self.players[player_id] = Scope(self.windows)
+        return scope
+
+    def add(self, metric, ts, value, player=None):
+        self.game.add(metric, ts, value)
+        if player is not None:
+            self.player(player.playerId).add(metric, ts, value)
+
+
+class StreamAnalytics:
+    def __init__(self, engine=None, windows=None, max_games=MAX_GAMES):
+        self.windows = dict(windows) if windows is not None else DEFAULT_WINDOWS
+        for spec in self.windows.values():
+            make_window(spec)  # Fail on bad specs now rather than on the first event
+        self.maxGames: int = max_games
+        self.games: OrderedDict = OrderedDict()  # Game id -> GameAnalytics, least recently seen first
+        self.now: Any = 0  # Engine time of the last event
+
+        self.engine = None
+        self.subscription = None
+        if engine is not None:
+            self.attach(engine)
+
+    def attach(self, engine):
+        self.engine = engine
+        self.subscription = engine.subscribe(self.on_event, list(self.HANDLERS))
+
+    def detach(self):
+        if self.engine is not None:
+            self.engine.unsubscribe(self.subscription)
+            self.engine = self.subscription = None
+
+    def _game(self, game_id):
+        game = self.games.get(game_id)
+        if game is None:
+            game = self.games[game_id] = GameAnalytics(game_id, self.windows)
+            if len(self.games) > self.maxGames:
+                self.games.popitem(last=False)
+        else:
+            self.games.move_to_end(game_id)
+        return game
+
+    def on_event(self, name, data):  # Event bus handler
+        handler = self.HANDLERS.get(name)
+        if handler is None:
+            return
+        engine = data['gameState']
+        now = self.now = engine.time
+        game = self._game(engine.gameId)
+        game.lastSeen = now
+        handler(self, game, engine, data.get('player'), now)
+
+    def _start_game(self, game, engine, player, now):  # Game ids are reused for every game played in a lobby
+        game.lastMeetingAt = False
+        game.killedAt.clear()
+        game.ventedAt.clear()
+        game.positions.clear()
+
+    def _murder(self, game, engine, killer, now):
+        game.add('kills', now, 1, killer)
+
+    def _murdered(self, game, engine, victim, now):
+        game.killedAt[victim.playerId] = now
+        game.positions.pop(victim.playerId, None)  # Ghost movement starts where the body is, not a jump
+
+    def _start_meeting(self, game, engine, player, now):
+        game.add('meetings', now, 1, engine.meetingStartedBy or None)
+        if game.lastMeetingAt is not False:
+            game.add('meetingInterval', now, now - game.lastMeetingAt)
+        game.lastMeetingAt = now
+        killed_at = game.killedAt.pop(engine.meetingReason, None) if engine.meetingReason != "Button" else None
+        if killed_at is not None:
+            game.add('killToReport', now, now - killed_at, engine.meetingStartedBy or None)
+        game.positions.clear()  # Everyone is moved to the table, that is not distance travelled
+
+    def _end_meeting(self, game, engine, player, now):
+        game.killedAt.clear()  # Bodies are cleaned up with the meeting
+        game.positions.clear()
+
+    def _movement(self, game, engine, player, now):
+        position = (player.x, player.y)
+        last = game.positions.get(player.playerId)
+        game.positions[player.playerId] = position
+        if last is not None and last != position:
+            game.add('distance', now, math.hypot(position[0] - last[0], position[1] - last[1]), player)
+
+    def _vent(self, game, engine, player, now):
+        if player.in_vent:
+            game.ventedAt[player.playerId] = now
+            game.add('ventEntries', now, 1, player)
+        else:
+            entered_at = game.ventedAt.pop(player.playerId, None)
+            if entered_at is not None:
+                game.add('ventTime', now, now - entered_at, player)
+            game.positions.pop(player.playerId, None)  # Vents move the player, that is not distance travelled
+
+    HANDLERS = {
+        'StartGame': _start_game,
+        'Murder': _murder,
+        'Murdered': _murdered,
+        'StartMeeting': _start_meeting,
+        'EndMeeting': _end_meeting,
+        'PlayerMovement': _movement,
+        'Vent': _vent,
+    }
+
+    #
+    # Queries, answered from the running aggregates
+    #
+
+    def game(self, game_id=None):  # Analytics of a game, the most recently active one by default
+        if game_id is None:
+            return next(reversed(self.games.values())) if self.games else None
+        return self.games.get(game_id)
+
+    def result(self, metric, window, player_id=None, game_id=None, closed=False):
+        game = self.game(game_id)
+        if game is None:
+            return None
+        scope = game.game if player_id is None else game.players.get(player_id)
+        if scope is None:
+            return None
+        return scope.result(metric, window, self.now, closed)
+
+    def rate(self, metric, window, per=60, player_id=None, game_id=None, closed=False):  # Total per `per` seconds
+        result = self.result(metric, window, player_id, game_id, closed)
+        if result is None:
+            return 0.0
+        return result.total * per / (result.end - result.start)
+
+    def mean(self, metric, window, player_id=None, game_id=None, closed=False):
+        result = self.result(metric, window, player_id, game_id, closed)
+        if result is None or not result.count:
+            return None
+        return result.total / result.count
+
+    def snapshot(self, game_id=None):
+        game = self.game(game_id)
+        if game is None:
+            return None
+        return {
+            'gameId': game.gameId,
+            'game': game.game.snapshot(self.now),
+            'players': {player_id: scope.snapshot(self.now) for player_id, scope in game.players.items()},
+        }
@@ -1,6 +1,10 @@
 import struct
+import sys
+import time
+from . import instrumentation
+from . import selector
 from .helpers import pack, unpack, invert
-from .internal import payloadClass
+from .internal import payloadClass, propsClass, EMPTY_PROPS, internBytes
 
 class layerBase:
 	def __init__(self, parent):
@@ -15,23 +19,31 @@ class layerBase:
 		self.initMap()
 		#self.map
 
-		self.props = {}
+		self.props = EMPTY_PROPS ## Shared empty record, command leafs get theirs once decoded
 		self.errorFlag = False
+		self.errorReason = False ## Why decoding stopped, exception name or "UnknownCommand"
 		self.children = []
 		self.commandLeafs = {} ## Reference indicating the command leaf belonging to the subcommand. Pass layer object to recieve command leaf for object
+		self.nodeIndex = None ## (layer name, command name) -> command leafs below this node, built on first lookup
 		self.parent = self.parentChildLink(parent)
 		self.layer = self.locateLayer()
 		
 		
 		self.commandName = "Root"
+		self.decodingCommand = "Root" ## Command currently being decoded, names the command in error stats
 		self.extranious = False
 	
 	def parse(self, payload):
 		payload.resetCounter()
+		stats = instrumentation.collector
 
 		try:
 			while payload.len():
-				childHandler, childPayload, props, extranious, currentCommandId, currentCommandName = self._process(payload)
+				self.decodingCommand = "Header" ## Size field and command byte, until the command is known
+				if stats is None:
+					childHandler, childPayload, props, extranious, currentCommandId, currentCommandName = self._process(payload)
+				else:
+					childHandler, childPayload, props, extranious, currentCommandId, currentCommandName = self._timedProcess(payload, stats)
 
 				commandChild = commandLeaf(self)
 				commandChild.props = props
@@ -46,9 +58,19 @@ class layerBase:
 					child.parse(childPayload)
 					self.commandLeafs[child] = commandChild
 		except:
-			self.handleError()
+			reason = sys.exc_info()[0].__name__
+			if stats is not None:
+				stats.record_error(self.name, self.decodingCommand, reason)
+			self.handleError(reason)
 			# print("LAYER ERROR", self.name)
 
+	def _timedProcess(self, payload, stats): ## _process while instrumentation is enabled
+		before = payload.len()
+		start = time.perf_counter()
+		result = self._process(payload)
+		stats.record_command(self.name, result[5], before - payload.len(), time.perf_counter() - start)
+		return result
+
 	def structUnpack(self, structure, myPayload):
 		output = []
 		if structure != False:
@@ -63,7 +85,7 @@ class layerBase:
 				if nStructDef in ['s', 'P', 'p', '?', 'X']: ## added special data types
 					if nStructDef == 's': # Variable length string
 						stringLength = myPayload.get(1)[0]
-						value = myPayload.get(stringLength)
+						value = internBytes(myPayload.get(stringLength))
 
 					if nStructDef == 'P': # array of packed data
 						unpackCount = struct.unpack("<B", myPayload.get(1))[0]
@@ -121,15 +143,19 @@ class layerBase:
 		try:
 			currentCommandName = self.map[currentCommandId]
 		except:
-			self.handleError()
+			self.handleError("UnknownCommand")
+			if instrumentation.collector is not None:
+				instrumentation.collector.record_error(self.name, str(currentCommandId), "UnknownCommand")
 			## Handle the error state internally as well
 			currentCommandName = "UNKNOWN! (Command Not Found) [" + str(currentCommandId) + "]"
 			extranious = myPayload.get(myPayload.len())
-			props = {}
+			props = EMPTY_PROPS
 			childHandler = False
 			childPayload = False
 			return childHandler, childPayload, props, extranious, currentCommandId, currentCommandName
 
+		self.decodingCommand = currentCommandName
+
 		## Get command structure
 		commandId, structure, argNames, childHandler = self.commands()[currentCommandName]
 
@@ -140,20 +166,51 @@ class layerBase:
 		
 		
 	def _handlePayload(self, myPayload, structure, argNames, childHandler):
-		output = {}
 		extranious = None
 
+		## One shared record class per argNames layout instead of a dict per command
 		results = self.structUnpack(structure, myPayload)
-		argOn = 0
-		for item in results:
-			output[argNames[argOn]] = item
-			argOn += 1
+		if len(results) < len(argNames): ## Some tables name more fields than the structure decodes (GameSettings v4)
+			argNames = argNames[:len(results)]
+		output = tuple.__new__(propsClass(argNames), results)
 
 		if not childHandler and myPayload.len():
 			extranious = myPayload.get(myPayload.len())
 
 		return output, extranious, myPayload
 
+	def index(self): ## Lazily built lookup of every command leaf below this node
+		if self.nodeIndex is None:
+			nodeIndex = {}
+			stack = [self]
+			while stack:
+				node = stack.pop()
+				if isinstance(node, commandLeaf):
+					nodeIndex.setdefault((node.parent.name, node.commandName), []).append(node)
+				stack.extend(reversed(node.children))
+			self.nodeIndex = nodeIndex
+		return self.nodeIndex
+
+	def find(self, layerName, commandName): ## All command leafs for a command, in packet order
+		return self.index().get((layerName, commandName), [])
+
+	def select(self, path): ## Command leafs matching a selector path such as "GameData/RpcCall/RPC/MurderPlayer"
+		return selector.select(self, path)
+
+	def parentCommand(self): ## For a command leaf, the command leaf on the layer above that carried this layer
+		layer = self.parent
+		if layer is None or layer.parent is None:
+			return None
+		return layer.parent.commandLeafs.get(layer)
+
+	def childCommands(self): ## For a command leaf, the command leafs of the layers its payload was handed to
+		layer = self.parent
+		leafs = []
+		for child in layer.children:
+			if layer.commandLeafs.get(child) is self and not isinstance(child, commandLeaf):
+				leafs += [leaf for leaf in child.children if isinstance(leaf, commandLeaf)]
+		return leafs
+
 	def addChild(self, child):
 		self.children.append(child)
 				
@@ -201,8 +258,9 @@ class layerBase:
 		return ('\t'*self.layer) + ('-'*extra)
 	
 
-	def handleError(self):
+	def handleError(self, reason="Error"):
 		self.errorFlag = 1
+		self.errorReason = reason
 		#die() ## switch on to pull out errors
 
 class commandLeaf(layerBase):
@@ -0,0 +1,178 @@
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from .. import parse
+from ..baseClasses import layerBase
+from ..gameEngine import GameEngine
+from . import corpus
+
+# Benchmark runner
+#
+# Throughput is the best of several repeats, everything else is measured in separate passes so the tracing used
+# for per layer times and memory does not leak into the packets/sec numbers.
+
+
+def best_of(repeat, run):
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def parse_rate(packets, repeat):
+    def run():
+        for packet in packets:
+            parse(packet)
+    return len(packets) / best_of(repeat, run)
+
+
+def engine_rate(timed_packets, repeat):
+    def run():
+        engine = GameEngine()
+        for ts, packet in timed_packets:
+            engine.proc(packet, ts)
+    return len(timed_packets) / best_of(repeat, run)
+
+
+def layer_times(run):  # Time spent in layerBase._process per layer, the decode of one command header and props
+    totals = {}
+    original = layerBase._process
+
+    def timed_process(self, payload):
+        start = time.perf_counter()
+        try:
+            return original(self, payload)
+        finally:
+            entry = totals.setdefault(self.name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - start
+
+    layerBase._process = timed_process
+    try:
+        run()
+    finally:
+        layerBase._process = original
+    return {name: {'calls': calls, 'seconds': seconds, 'usPerCall': seconds / calls * 1e6}
+            for name, (calls, seconds) in sorted(totals.items())}
+
+
+def memory(run, count):  # Peak traced memory of a run plus what it still holds on to afterwards
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before_size, before_peak = tracemalloc.get_traced_memory()
+        blocks_before = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        kept = run()
+        size, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename')) - blocks_before
+    finally:
+        tracemalloc.stop()
+    del kept
+    return {'peakBytes': peak - before_size, 'retainedBytesPerPacket': (size - before_size) / count,
+            'retainedBlocksPerPacket': blocks / count}
+
+
+def parse_all(packets):
+    return [parse(packet) for packet in packets]
+
+
+def engine_all(timed_packets):
+    engine = GameEngine()
+    for ts, packet in timed_packets:
+        engine.proc(packet, ts)
+    return engine
+
+
+def bench_stream(timed_packets, repeat):
+    packets = [packet for ts, packet in timed_packets]
+    return {
+        'packets': len(packets),
+        'bytes': sum(len(packet) for packet in packets),
+        'parsePacketsPerSec': parse_rate(packets, repeat),
+        'enginePacketsPerSec': engine_rate(timed_packets, repeat),
+        'parseLayers': layer_times(lambda: parse_all(packets)),
+        'engineLayers': layer_times(lambda: engine_all(timed_packets)),
+        'parseMemory': memory(lambda: parse_all(packets), len(packets)),
+        'engineMemory': memory(lambda: engine_all(timed_packets), len(packets)),
+    }
+
+
+def run(count=2000, mix_count=20000, games=3, seed=0, repeat=3, log=None):
+    results = {
+        'meta': {'python': sys.version, 'platform': platform.platform(), 'seed': seed, 'count': count,
+                 'mixCount': mix_count, 'games': games, 'repeat': repeat, 'time': time.time()},
+        'commands': {},
+        'mixes': {},
+    }
+
+    for layer_cls, command in corpus.all_commands():
+        key = corpus.layer_info(layer_cls).name + '/' + command
+        packets = corpus.command_corpus(layer_cls, command, count, seed)
+        results['commands'][key] = {'packets': len(packets), 'parsePacketsPerSec': parse_rate(packets, repeat)}
+        if log:
+            log('%-32s %12.0f pkt/s' % (key, results['commands'][key]['parsePacketsPerSec']))
+
+    for mix in corpus.MIXES:
+        packets = corpus.mix_corpus(mix, mix_count, seed)
+        results['mixes'][mix] = bench_stream([(i * 0.01, packet) for i, packet in enumerate(packets)], repeat)
+        if log:
+            log('mix %-28s %12.0f pkt/s parse %12.0f pkt/s engine' % (
+                mix, results['mixes'][mix]['parsePacketsPerSec'], results['mixes'][mix]['enginePacketsPerSec']))
+
+    results['games'] = bench_stream(corpus.scripted_games(games, seed), repeat)
+    if log:
+        log('scripted games %21.0f pkt/s parse %12.0f pkt/s engine' % (
+            results['games']['parsePacketsPerSec'], results['games']['enginePacketsPerSec']))
+    return results
+
+
+def _rates(results):
+    rates = {}
+    for key, entry in results.get('commands', {}).items():
+        rates['commands/' + key + '/parse'] = entry['parsePacketsPerSec']
+    streams = dict(('mixes/' + key, entry) for key, entry in results.get('mixes', {}).items())
+    if 'games' in results:
+        streams['games'] = results['games']
+    for key, entry in streams.items():
+        rates[key + '/parse'] = entry['parsePacketsPerSec']
+        rates[key + '/engine'] = entry['enginePacketsPerSec']
+    return rates
+
+
+def compare(base, current):  # [(name, base pkt/s, current pkt/s, ratio)] for every rate both runs have
+    base_rates = _rates(base)
+    current_rates = _rates(current)
+    return [(key, base_rates[key], current_rates[key], current_rates[key] / base_rates[key])
+            for key in current_rates if key in base_rates]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parser and game engine benchmarks on synthetic traffic")
+    parser.add_argument('--count', type=int, default=2000, help="packets per command corpus")
+    parser.add_argument('--mix-count', type=int, default=20000, help="packets per phase mix")
+    parser.add_argument('--games', type=int, default=3, help="scripted games to replay")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="throughput repeats, the best one is kept")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    results = run(args.count, args.mix_count, args.games, args.seed, args.repeat, log=print)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=1)
+    if args.compare:
+        with open(args.compare) as base_file:
+            base = json.load(base_file)
+        for key, base_rate, rate, ratio in compare(base, results):
+            print('%-48s %12.0f -> %12.0f  %+6.1f%%' % (key, base_rate, rate, (ratio - 1) * 100))
+    return results
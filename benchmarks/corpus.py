@@ -0,0 +1,328 @@
+import random
+import struct
+
+from .. import layers
+from ..encoder import msg, encode, layer_info, field_kinds, LAYER_CLASSES
+from ..helpers import packInt
+
+# Synthetic packet corpora for the benchmarks
+#
+# Packets are described as encoder.Msg trees and encoded with the same command tables the parser uses.
+# Everything is driven by a seeded random.Random so a corpus is reproducible from (kind, count, seed).
+
+SERVER_ID = 4294967294
+
+
+#
+# Random props
+#
+
+NAMES = [b'Red', b'Blue', b'Green', b'Pink', b'Orange', b'Yellow', b'Black', b'White', b'Purple', b'Brown',
+         b'Cyan', b'Lime', b'xXSusXx', b'Crewmate', b'Imposter']
+CHAT = [b'where', b'who', b'sus', b'skip', b'I was in electrical', b'red vented', b'its not me', b'gg']
+
+_INT_RANGES = {'b': (-128, 127), 'B': (0, 255), 'h': (-32768, 32767), 'H': (0, 65535),
+               'i': (-2 ** 31, 2 ** 31 - 1), 'l': (-2 ** 31, 2 ** 31 - 1), 'I': (0, 2 ** 32 - 1),
+               'L': (0, 2 ** 32 - 1), 'q': (-2 ** 63, 2 ** 63 - 1), 'Q': (0, 2 ** 64 - 1)}
+
+
+def random_field(rng, kind):
+    if kind == 's':
+        return rng.choice(NAMES)
+    if kind == 'P':
+        return [rng.randrange(15) for i in range(rng.randrange(4))]
+    if kind in 'pX':
+        return rng.randrange(1, 2000)
+    if kind == '?':
+        return bytes(rng.randrange(256) for i in range(rng.randrange(1, 24)))
+    if kind in 'fd':
+        return rng.uniform(0.5, 3.0)
+    if kind == 'c':
+        return bytes([rng.randrange(256)])
+    low, high = _INT_RANGES[kind]
+    return rng.randint(low, high)
+
+
+def random_props(rng, layer_cls, command):
+    command_id, structure, arg_names, child_handler = layer_info(layer_cls).commands()[command]
+    return {name: random_field(rng, kind) for kind, name in zip(field_kinds(structure), arg_names)}
+
+
+#
+# Valid blobs for the objects the engine decodes
+#
+
+def movement_blob(seq, x, y):
+    return struct.pack('<HHHHH', seq & 65535, x & 65535, y & 65535, 32767, 32767)
+
+
+def game_data_blob(players):  # [(player id, name)]
+    return bytes([len(players)]) + b''.join(bytes([player_id, len(name)]) + name + bytes(6)
+                                            for player_id, name in players)
+
+
+def ship_status_blob(rng):  # Initial Skeld system state, see spawnDecoders.SKELD_SYSTEMS
+    return (struct.pack('<f', 10000.0) + b'\x00' + bytes([rng.randrange(32)] * 2) + b'\x00' +
+            struct.pack('<f', 10000.0) + b'\x00' + b'\x00' + b'\x00' + b'\x00' + b'\x01' * 13 +
+            struct.pack('<f', 0.0))
+
+
+def spawn_children(rng, spawn_name, net_id, player_id=0):
+    sub = layers.spawnSubcommandLayer
+    if spawn_name == 'Player':
+        return [msg(sub, '1', {'netId': net_id, 'data': bytes([1, player_id])}),
+                msg(sub, '1', {'netId': net_id + 1, 'data': b''}),
+                msg(sub, '1', {'netId': net_id + 2, 'data': movement_blob(0, 32767, 32767)})]
+    if spawn_name == 'GameData':
+        players = [(i, rng.choice(NAMES)) for i in range(rng.randrange(1, 11))]
+        return [msg(sub, '1', {'netId': net_id, 'data': game_data_blob(players)}),
+                msg(sub, '1', {'netId': net_id + 1, 'data': b''})]
+    if spawn_name in ('ShipStatus', 'AprilShipStatus'):
+        return [msg(sub, '1', {'netId': net_id, 'data': ship_status_blob(rng)})]
+    if spawn_name == 'MeetingHud':
+        return [msg(sub, '1', {'netId': net_id, 'data': bytes(rng.randrange(4, 11))})]
+    return [msg(sub, '1', {'netId': net_id, 'data': random_field(rng, '?')})]
+
+
+#
+# Wrapping a command into a whole packet
+#
+
+def _find_parents():
+    parents = {}
+    for layer_cls in LAYER_CLASSES:
+        for command, (command_id, structure, arg_names, child_handler) in layer_info(layer_cls).commands().items():
+            if child_handler and child_handler not in parents:
+                parents[child_handler] = (layer_cls, command)
+    return parents
+
+
+PARENTS = _find_parents()  # Layer -> (parent layer, command that carries it), the first route found in the tables
+PARENTS[layers.spawnSubcommandLayer] = (layers.spawnLayer, 'HeadQuarters')  # Components without a blob decoder
+
+
+def wrap(rng, message, seq=0):  # Nest a message under the parents its layer needs, up to the Hazil root
+    while message.layer is not layers.hazilLayer:
+        parent_layer, parent_command = PARENTS[message.layer]
+        props = random_props(rng, parent_layer, parent_command)
+        if parent_layer is layers.hazilLayer:
+            props['seq'] = seq & 65535
+        message = msg(parent_layer, parent_command, props, [message])
+    return message
+
+
+def command_message(rng, layer_cls, command, state):  # One valid looking message for any command in the tables
+    props = random_props(rng, layer_cls, command)
+    children = []
+    if layer_cls is layers.spawnLayer:
+        state['netId'] += 3
+        children = spawn_children(rng, command, state['netId'], rng.randrange(10))
+        props['spawnCount'] = len(children)
+    elif layer_cls is layers.gameDataLayer and command == 'Data':
+        props['data'] = movement_blob(rng.randrange(65536), rng.randrange(65536), rng.randrange(65536))
+    else:
+        child_handler = layer_info(layer_cls).commands()[command][3]
+        if child_handler:
+            child_command = rng.choice(list(layer_info(child_handler).commands()))
+            children = [command_message(rng, child_handler, child_command, state)]
+    return msg(layer_cls, command, props, children)
+
+
+def all_commands():  # (layer class, command name) for every command in layers.py
+    return [(layer_cls, command) for layer_cls in LAYER_CLASSES for command in layer_info(layer_cls).commands()]
+
+
+def command_corpus(layer_cls, command, count, seed=0):
+    rng = random.Random(seed)
+    state = {'netId': 1000}
+    return [encode(wrap(rng, command_message(rng, layer_cls, command, state), i)) for i in range(count)]
+
+
+#
+# Phase mixes, weights are by (layer name, command name)
+#
+
+MIXES = {
+    'lobby': {
+        ('GameData', 'Data'): 40, ('Hazil', 'Ack'): 15, ('Hazil', 'Ping'): 5,
+        ('RPC', 'SetName'): 3, ('RPC', 'SetColor'): 3, ('RPC', 'SetHat'): 3, ('RPC', 'SetSkin'): 3,
+        ('RPC', 'SetPet'): 3, ('RPC', 'SendChat'): 6, ('RPC', 'SyncSettings'): 2,
+        ('UpdateGameData', 'Player'): 4, ('Spawn', 'Player'): 2, ('InnerNet', 'JoinGame'): 1,
+        ('GameListV2', 'LobbyList'): 1,
+    },
+    'gameplay': {
+        ('GameData', 'Data'): 70, ('Hazil', 'Ack'): 12, ('Hazil', 'Ping'): 3,
+        ('RPC', 'SnapTo'): 3, ('RPC', 'EnterVent'): 1, ('RPC', 'ExitVent'): 1, ('RPC', 'CompleteTask'): 3,
+        ('RPC', 'MurderPlayer'): 1, ('RPC', 'RepairSystem'): 2, ('RPC', 'CloseDoorsOfType'): 1,
+        ('RPC', 'PlayAnimation'): 2, ('RPC', 'SetScanner'): 1,
+    },
+    'meeting': {
+        ('Hazil', 'Ack'): 25, ('Hazil', 'Ping'): 5, ('RPC', 'SendChat'): 30, ('RPC', 'StartMeeting'): 2,
+        ('RPC', 'ReportDeadBody'): 2, ('Spawn', 'MeetingHud'): 2, ('RPC', 'CastVote'): 10,
+        ('RPC', 'VotingComplete'): 2, ('RPC', 'Close'): 2, ('UpdateGameData', 'Player'): 5,
+        ('GameData', 'Despawn'): 2,
+    },
+}
+
+
+def _layer_by_name():
+    return {layer_info(layer_cls).name: layer_cls for layer_cls in LAYER_CLASSES}
+
+
+def mix_corpus(mix, count, seed=0):
+    rng = random.Random(seed)
+    by_name = _layer_by_name()
+    weights = MIXES[mix] if isinstance(mix, str) else mix
+    keys = list(weights)
+    picks = rng.choices(keys, [weights[key] for key in keys], k=count)
+    state = {'netId': 1000}
+    return [encode(wrap(rng, command_message(rng, by_name[layer_name], command, state), i))
+            for i, (layer_name, command) in enumerate(picks)]
+
+
+#
+# Scripted games, a whole lobby from join to end with consistent ids
+#
+
+class GameScript:
+    def __init__(self, seed=0, players=10, game_id=0x80000000 | 12345, start_time=0.0):
+        self.rng = random.Random(seed)
+        self.gameId = game_id
+        self.time = start_time
+        self.seq = 0  # Hazel seq of the last ReliableData, unreliable packets carry none
+        self.ackedSeq = 0
+        self.netId = 10
+        self.clientIds = list(range(1, players + 1))
+        self.players = {}  # player id -> (client id, player control net id, network transform net id)
+        self.alive = set()
+        self.moveSeq = 0
+        self.packets = []
+
+    def ack(self, dt):  # Acks the last reliable packet, once
+        if self.ackedSeq == self.seq:
+            return
+        self.ackedSeq = self.seq
+        self.time += dt
+        self.packets.append((self.time, encode(msg(layers.hazilLayer, 'Ack', {'seq': self.seq & 65535, 'flag': 255}))))
+
+    def emit(self, dt, *messages, reliable=True):  # Queue one packet carrying the given GameData messages
+        self.time += dt
+        if reliable:
+            self.seq += 1
+        root = msg(layers.hazilLayer, 'ReliableData' if reliable else 'UnreliableData',
+                   {'seq': self.seq & 65535} if reliable else {}, messages)
+        self.packets.append((self.time, encode(root)))
+
+    def game_data(self, *messages):
+        return msg(layers.innerLayer, 'GameData', {'gameId': self.gameId}, messages)
+
+    def rpc(self, net_id, command, props=None, children=()):
+        return msg(layers.gameDataLayer, 'RpcCall', {'ownerId': net_id},
+                   [msg(layers.rpcLayer, command, props, children)])
+
+    def spawn(self, spawn_name, client_id, children):
+        spawn = msg(layers.spawnLayer, spawn_name, {'clientId': client_id, 'U1': 0, 'spawnCount': len(children)},
+                    children)
+        return msg(layers.gameDataLayer, 'Spawn', {}, [spawn])
+
+    def new_net_ids(self, count):
+        self.netId += count
+        return self.netId - count
+
+    def lobby(self):
+        self.emit(0.0, msg(layers.innerLayer, 'JoinedGame', {'gameId': self.gameId, 'clientId': 1,
+                                                             'hostclientId': 1, 'otherclientIdssPacked': []}))
+        roster = [(player_id, NAMES[player_id % len(NAMES)]) for player_id in range(len(self.clientIds))]
+        net_id = self.new_net_ids(2)
+        self.emit(0.05, self.game_data(self.spawn('GameData', SERVER_ID, [
+            msg(layers.spawnSubcommandLayer, '1', {'netId': net_id, 'data': game_data_blob(roster)}),
+            msg(layers.spawnSubcommandLayer, '1', {'netId': net_id + 1, 'data': b''})])))
+        self.emit(0.05, self.game_data(self.spawn('Lobby', SERVER_ID, spawn_children(self.rng, 'Lobby',
+                                                                                     self.new_net_ids(1)))))
+        for player_id, client_id in enumerate(self.clientIds):
+            net_id = self.new_net_ids(3)
+            self.players[player_id] = (client_id, net_id, net_id + 2)
+            self.alive.add(player_id)
+            self.emit(0.1, self.game_data(self.spawn('Player', client_id,
+                                                     spawn_children(self.rng, 'Player', net_id, player_id))))
+            self.emit(0.1, self.game_data(self.rpc(net_id, 'SetName', {'name': roster[player_id][1]})),
+                      self.game_data(self.rpc(net_id, 'SetColor', {'id': player_id})))
+            self.emit(0.05, self.game_data(self.rpc(net_id, 'SetHat', {'id': self.rng.randrange(90)})))
+        settings = random_props(self.rng, layers.gameSettingsLayer, 'v4')
+        self.emit(0.1, self.game_data(self.rpc(self.players[0][1], 'SyncSettings', children=[
+            msg(layers.gameSettingsLayer, 'v4', settings)])))
+        self.movement(3.0)
+
+    def movement(self, seconds, rate=0.05):
+        steps = int(seconds / rate)
+        for step in range(steps):
+            self.moveSeq += 1
+            messages = [msg(layers.gameDataLayer, 'Data', {'ownerId': transform, 'data': movement_blob(
+                self.moveSeq, self.rng.randrange(20000, 45000), self.rng.randrange(20000, 45000))})
+                        for player_id, (client_id, control, transform) in self.players.items()
+                        if player_id in self.alive]
+            self.emit(rate, self.game_data(*messages), reliable=False)
+            if step % 10 == 0:
+                self.ack(0.0)
+
+    def play(self, rounds=3):
+        self.emit(0.5, msg(layers.innerLayer, 'StartGame', {'gameId': self.gameId}))
+        ship_net_id = self.new_net_ids(1)
+        self.emit(0.1, self.game_data(self.spawn('ShipStatus', SERVER_ID, [
+            msg(layers.spawnSubcommandLayer, '1', {'netId': ship_net_id, 'data': ship_status_blob(self.rng)})])))
+        impostors = self.rng.sample(sorted(self.alive), 2)
+        self.emit(0.1, self.game_data(self.rpc(self.players[0][1], 'SetInfected', {'playerIdList': impostors})))
+
+        for round_number in range(rounds):
+            self.movement(10.0)
+            killer = self.rng.choice([player_id for player_id in impostors if player_id in self.alive] or impostors)
+            victims = [player_id for player_id in self.alive if player_id not in impostors]
+            if not victims:
+                break
+            victim = self.rng.choice(victims)
+            self.emit(0.1, self.game_data(self.rpc(self.players[killer][1], 'EnterVent', {'ventId': 3})))
+            self.emit(0.5, self.game_data(self.rpc(self.players[killer][1], 'ExitVent', {'ventId': 5})))
+            self.emit(0.1, self.game_data(self.rpc(self.players[killer][1], 'MurderPlayer',
+                                                   {'netId': self.players[victim][1]})))
+            self.alive.discard(victim)
+            self.movement(3.0)
+            self.meeting(victim)
+        self.emit(1.0, msg(layers.innerLayer, 'EndGame', {'gameId': self.gameId, 'reason?': 0}))
+
+    def meeting(self, victim):
+        reporter = self.rng.choice(sorted(self.alive))
+        reporter_net_id = self.players[reporter][1]
+        self.emit(0.1, self.game_data(self.rpc(reporter_net_id, 'ReportDeadBody', {'playerId': victim})))
+        self.emit(0.1, self.game_data(self.rpc(reporter_net_id, 'StartMeeting', {'playerId': victim})))
+        hud_net_id = self.new_net_ids(1)
+        self.emit(0.1, self.game_data(self.spawn('MeetingHud', SERVER_ID, [
+            msg(layers.spawnSubcommandLayer, '1', {'netId': hud_net_id, 'data': bytes(len(self.players))})])))
+        for player_id in sorted(self.alive):
+            self.emit(self.rng.uniform(0.5, 3.0), self.game_data(self.rpc(
+                self.players[player_id][1], 'SendChat', {'message': self.rng.choice(CHAT)})))
+        for player_id in sorted(self.alive):
+            vote = bytes([0x40 | (self.rng.choice(sorted(self.alive)) + 1)])
+            self.emit(0.5, self.game_data(msg(layers.gameDataLayer, 'Data', {
+                'ownerId': hud_net_id, 'data': packInt(1 << player_id) + vote})))
+        exiled = self.rng.choice(sorted(self.alive) + [255])
+        self.emit(0.5, self.game_data(self.rpc(hud_net_id, 'VotingComplete', {
+            'states': bytes(len(self.players)), 'exiledPlayerId': exiled, 'tie': 0})))
+        self.emit(5.0, self.game_data(self.rpc(hud_net_id, 'Close')))
+        self.emit(0.1, self.game_data(msg(layers.gameDataLayer, 'Despawn', {'netId': hud_net_id})))
+        self.alive.discard(exiled)
+
+
+def scripted_game(seed=0, players=10, rounds=3, start_time=0.0, game_id=0x80000000 | 12345):
+    # [(timestamp, packet)] for one whole game
+    script = GameScript(seed, players, game_id, start_time)
+    script.lobby()
+    script.play(rounds)
+    return script.packets
+
+
+def scripted_games(count, seed=0, players=10, rounds=3):
+    packets = []
+    for game in range(count):
+        start = packets[-1][0] + 10.0 if packets else 0.0
+        packets += scripted_game(seed + game, players, rounds, start)
+    return packets
@@ -0,0 +1,90 @@
+import argparse
+import heapq
+import socket
+import time
+
+from . import corpus
+
+# UDP traffic generator for load testing ingestion
+#
+# Scripted games are encoded up front, then replayed to a UDP socket either at a fixed packet rate or at the pace
+# of their own timestamps (optionally sped up). Several lobbies can be interleaved, each with its own game id.
+
+
+def lobby_traffic(lobbies=1, seed=0, players=10, rounds=3):  # [(timestamp, packet)] of concurrent games
+    games = [corpus.scripted_game(seed + lobby, players, rounds, lobby * 0.37, 0x80000000 | (12345 + lobby))
+             for lobby in range(lobbies)]
+    return list(heapq.merge(*games, key=lambda record: record[0]))
+
+
+class TrafficGenerator:
+    def __init__(self, host='127.0.0.1', port=22023, rate=None, speed=1.0):
+        self.address = (host, port)
+        self.rate = rate  # Packets per second, None replays at the pace of the packet timestamps
+        self.speed = speed  # Time scale for timestamp paced replay
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sent = 0
+        self.sentBytes = 0
+
+    def close(self):
+        self.socket.close()
+
+    def send(self, timed_packets, duration=None, loop=False):  # Returns (packets, bytes, seconds) for this call
+        sendto = self.socket.sendto
+        address = self.address
+        sent = sent_bytes = 0
+        start = time.perf_counter()
+        offset = 0.0  # Timeline offset of the current loop pass
+        first_ts = timed_packets[0][0] if timed_packets else 0.0
+        span = (timed_packets[-1][0] - first_ts + 1.0) if timed_packets else 0.0
+
+        while timed_packets:
+            for ts, packet in timed_packets:
+                if self.rate:
+                    due = start + sent / self.rate
+                else:
+                    due = start + (offset + ts - first_ts) / self.speed
+                now = time.perf_counter()
+                if due - now > 0.001:  # Only sleep when meaningfully ahead, bursts keep high rates reachable
+                    time.sleep(due - now)
+                    now = due
+                if duration is not None and now - start >= duration:
+                    loop = False
+                    break
+                sendto(packet, address)
+                sent += 1
+                sent_bytes += len(packet)
+            if not loop:
+                break
+            offset += span
+
+        self.sent += sent
+        self.sentBytes += sent_bytes
+        return sent, sent_bytes, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay scripted Among Us games to a UDP port")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=22023)
+    parser.add_argument('--rate', type=float, help="packets per second, default is the pace of the script")
+    parser.add_argument('--speed', type=float, default=1.0, help="time scale when pacing by the script")
+    parser.add_argument('--lobbies', type=int, default=1, help="concurrent games to interleave")
+    parser.add_argument('--players', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    parser.add_argument('--loop', action='store_true', help="replay the games until --duration runs out")
+    args = parser.parse_args(argv)
+
+    packets = lobby_traffic(args.lobbies, args.seed, args.players, args.rounds)
+    generator = TrafficGenerator(args.host, args.port, args.rate, args.speed)
+    try:
+        sent, sent_bytes, seconds = generator.send(packets, args.duration, args.loop)
+    finally:
+        generator.close()
+    print('sent %d packets (%d bytes) in %.2fs, %.0f pkt/s' % (sent, sent_bytes, seconds, sent / max(seconds, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections import namedtuple
+from typing import Union, Any, Dict, List
+
+# Compact capture files of game traffic
+#
+# Only what GameEngine.proc needs is stored: timestamp, flow, direction and the UDP payload. A file is
+#
+#	header		magic, version
+#	blocks		block header (magic, flags, stored size, raw size, record count) and the records, zlib compressed
+#	footer		index of every block (offset, first ts, last ts, records) and the flow table, as compressed JSON
+#	trailer		footer offset and end magic
+#
+# A record is a <dIBH header (timestamp, flow id, direction, payload length) followed by the payload. Flow keys are
+# given small ids the first time they are seen, defined by a record with the FLOW_DEFINITION direction whose payload
+# is the key as JSON, so a file cut short before its footer can still be read block by block. The footer repeats
+# the flow table, so a complete file only needs the blocks overlapping the requested time range.
+#
+# CaptureReader maps the file and hands payloads out as memoryviews: slices of the map for uncompressed blocks, of
+# the decompressed block otherwise. Nothing is copied per record, parse() copies a view into bytes before decoding
+# so nothing it keeps pins the map.
+
+MAGIC = b'AUCAP\x00\x01\x00'
+END_MAGIC = b'AUCAPEND'
+BLOCK_MAGIC = b'BLK0'
+FOOTER_MAGIC = b'IDX0'
+EXTENSION = '.aucap'
+
+CLIENT, SERVER, UNKNOWN, FLOW_DEFINITION = 0, 1, 2, 255
+DIRECTIONS = {False: CLIENT, True: SERVER, None: UNKNOWN}
+FROM_SERVER = {CLIENT: False, SERVER: True, UNKNOWN: None}
+NO_FLOW = 0xffffffff
+
+COMPRESSED = 1  # Block flags
+
+_record = struct.Struct('<dIBH')
+_block = struct.Struct('<4sBIII')
+_trailer = struct.Struct('<Q8s')
+
+BLOCK_SIZE = 1 << 16
+MAX_PAYLOAD = 0xffff
+
+Record = namedtuple('Record', ['ts', 'data', 'flow', 'fromServer'])  # Same order merge.CaptureMerger reads
+BlockIndex = namedtuple('BlockIndex', ['offset', 'firstTs', 'lastTs', 'records'])
+
+
+def _flow_key(value):  # JSON turns tuples into lists, flows have to come back hashable
+    if isinstance(value, list):
+        return tuple(_flow_key(item) for item in value)
+    return value
+
+
+class CaptureWriter:
+    def __init__(self, path, block_size=BLOCK_SIZE, compression=6):
+        self.path = path
+        self.blockSize: int = block_size
+        self.compression: Union[bool, Any] = compression  # zlib level, None stores blocks uncompressed
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.offset: int = len(MAGIC)
+
+        self.buffer = bytearray()
+        self.blockRecords: int = 0
+        self.blockFirstTs: Any = None
+        self.blockLastTs: Any = None
+        self.index: List[BlockIndex] = []
+        self.flows: Dict[Any, int] = {}  # Flow key -> flow id
+        self.records: int = 0
+        self.firstTs: Any = None
+        self.lastTs: Any = None
+        self.closed: bool = False
+
+    def _flow_id(self, flow):
+        if flow is None:
+            return NO_FLOW
+        flow_id = self.flows.get(flow)
+        if flow_id is None:
+            flow_id = self.flows[flow] = len(self.flows)
+            definition = json.dumps(flow, separators=(',', ':'), default=str).encode()
+            self.buffer += _record.pack(0.0, flow_id, FLOW_DEFINITION, len(definition))
+            self.buffer += definition
+        return flow_id
+
+    def write(self, ts, data, flow=None, from_server=None):
+        if len(data) > MAX_PAYLOAD:
+            raise ValueError("Payload of %d bytes does not fit a capture record" % len(data))
+        flow_id = self._flow_id(flow)
+        self.buffer += _record.pack(ts, flow_id, DIRECTIONS.get(from_server, UNKNOWN), len(data))
+        self.buffer += data
+        self.blockRecords += 1
+        if self.blockFirstTs is None:
+            self.blockFirstTs = ts
+        self.blockLastTs = ts
+        if self.firstTs is None:
+            self.firstTs = ts
+        self.lastTs = ts
+        self.records += 1
+        if len(self.buffer) >= self.blockSize:
+            self.flush_block()
+
+    def flush_block(self):
+        if not self.buffer:
+            return
+        raw = bytes(self.buffer)
+        flags = 0
+        stored = raw
+        if self.compression is not None:
+            compressed = zlib.compress(raw, self.compression)
+            if len(compressed) < len(raw):
+                flags, stored = COMPRESSED, compressed
+        self.file.write(_block.pack(BLOCK_MAGIC, flags, len(stored), len(raw), self.blockRecords))
+        self.file.write(stored)
+        self.index.append(BlockIndex(self.offset, self.blockFirstTs, self.blockLastTs, self.blockRecords))
+        self.offset += _block.size + len(stored)
+        del self.buffer[:]
+        self.blockRecords = 0
+        self.blockFirstTs = self.blockLastTs = None
+
+    def flush(self):  # Writes out the open block, the file stays readable up to here even without a footer
+        self.flush_block()
+        self.file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush_block()
+        footer = {
+            'blocks': [list(entry) for entry in self.index],
+            'flows': [[flow_id, flow] for flow, flow_id in self.flows.items()],
+        }
+        footer = zlib.compress(json.dumps(footer, separators=(',', ':'), default=str).encode())
+        self.file.write(FOOTER_MAGIC + footer)
+        self.file.write(_trailer.pack(self.offset, END_MAGIC))
+        self.file.close()
+        self.closed = True
+
+    def size(self):  # Bytes written so far, including the open block before compression
+        return self.offset + len(self.buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+class CaptureRecorder:  # Sits in front of GameEngine.proc, records every packet into rotating capture files
+    def __init__(self, prefix, engine=None, rotate_bytes=64 << 20, rotate_seconds=3600, **writer_options):
+        self.prefix = prefix  # Files are named prefix-000001.aucap, prefix-000002.aucap, ...
+        self.engine = engine
+        self.rotateBytes = rotate_bytes  # None disables either limit
+        self.rotateSeconds = rotate_seconds
+        self.writerOptions = writer_options
+        self.writer: Union[bool, CaptureWriter] = None
+        self.fileNumber: int = 0
+        self.paths: List[str] = []
+
+    def _open(self):
+        self.fileNumber += 1
+        path = '%s-%06d%s' % (self.prefix, self.fileNumber, EXTENSION)
+        self.writer = CaptureWriter(path, **self.writerOptions)
+        self.paths.append(path)
+
+    def _should_rotate(self, ts):
+        writer = self.writer
+        if self.rotateBytes is not None and writer.size() >= self.rotateBytes:
+            return True
+        if self.rotateSeconds is not None and writer.firstTs is not None:
+            return ts - writer.firstTs >= self.rotateSeconds
+        return False
+
+    def write(self, ts, data, flow=None, from_server=None):
+        if self.writer is None:
+            self._open()
+        elif self._should_rotate(ts):
+            self.writer.close()
+            self._open()
+        self.writer.write(ts, data, flow, from_server)
+
+    def proc(self, data, ts, flow=None, from_server=None):  # Same arguments as GameEngine.proc
+        self.write(ts, data, flow, from_server)
+        if self.engine is not None:
+            return self.engine.proc(data, ts, flow, from_server)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+class CaptureReader:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.view = memoryview(self.map)
+        if bytes(self.view[:len(MAGIC)]) != MAGIC:
+            self.close()
+            raise ValueError("%s is not a capture file" % path)
+        self.flows: Dict[int, Any] = {}  # Flow id -> flow key, from the footer or filled in while reading
+        self.index: List[BlockIndex] = self._read_index()
+        self.complete: bool = self.index is not None  # False for a file cut short before its footer
+
+    def _read_index(self):
+        if len(self.view) < len(MAGIC) + _trailer.size:
+            return None
+        footer_offset, end_magic = _trailer.unpack_from(self.view, len(self.view) - _trailer.size)
+        if end_magic != END_MAGIC or bytes(self.view[footer_offset:footer_offset + 4]) != FOOTER_MAGIC:
+            return None
+        footer = json.loads(zlib.decompress(self.view[footer_offset + 4:len(self.view) - _trailer.size]))
+        for flow_id, flow in footer['flows']:
+            self.flows[flow_id] = _flow_key(flow)
+        return [BlockIndex(*entry) for entry in footer['blocks']]
+
+    def _scan(self):  # Block offsets found by walking the headers, for files without a footer
+        offset = len(MAGIC)
+        end = len(self.view)
+        while offset + _block.size <= end:
+            magic, flags, stored, raw, records = _block.unpack_from(self.view, offset)
+            if magic != BLOCK_MAGIC or offset + _block.size + stored > end:
+                return
+            yield offset
+            offset += _block.size + stored
+
+    def block(self, offset):  # memoryview of the raw records of the block at offset
+        magic, flags, stored, raw, records = _block.unpack_from(self.view, offset)
+        body = self.view[offset + _block.size:offset + _block.size + stored]
+        if flags & COMPRESSED:
+            return memoryview(zlib.decompress(body, bufsize=raw))
+        return body
+
+    def _records(self, block, start, end):
+        offset = 0
+        size = len(block)
+        flows = self.flows
+        while offset < size:
+            ts, flow_id, direction, length = _record.unpack_from(block, offset)
+            offset += _record.size
+            data = block[offset:offset + length]
+            offset += length
+            if direction == FLOW_DEFINITION:
+                flows[flow_id] = _flow_key(json.loads(bytes(data)))
+                continue
+            if (start is not None and ts < start) or (end is not None and ts > end):
+                continue
+            yield Record(ts, data, flows.get(flow_id), FROM_SERVER.get(direction))
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self, start=None, end=None):  # Records with start <= ts <= end
+        if self.index is None:
+            offsets = self._scan()
+        else:
+            # Flows come from the footer, only blocks overlapping the range are read
+            offsets = (entry.offset for entry in self.index
+                       if (end is None or entry.firstTs is None or entry.firstTs <= end)
+                       and (start is None or entry.lastTs is None or entry.lastTs >= start))
+        for offset in offsets:
+            yield from self._records(self.block(offset), start, end)
+
+    def close(self):
+        try:
+            self.view.release()
+            if isinstance(self.map, mmap.mmap):
+                self.map.close()
+        except BufferError:
+            pass  # Payload views are still held, the map is closed once they are garbage collected
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+def read_captures(paths, start=None, end=None):  # Records of several capture files in turn, e.g. recorder.paths
+    for path in paths:
+        with CaptureReader(path) as reader:
+            yield from (Record(record.ts, bytes(record.data), record.flow, record.fromServer)
+                        for record in reader.records(start, end))
+
+
+def replay(paths, engine, start=None, end=None):  # Feeds capture files through GameEngine.proc
+    fed = 0
+    for path in paths:
+        with CaptureReader(path) as reader:
+            for record in reader.records(start, end):  # Views go straight in, parse() copies what it decodes
+                engine.proc(record.data, record.ts, record.flow, record.fromServer)
+                fed += 1
+    return fed
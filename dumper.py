@@ -0,0 +1,144 @@
+import base64
+import binascii
+import json
+
+from .baseClasses import commandLeaf
+
+# Streaming JSON lines dumps of parse trees
+#
+# Every dumped packet becomes one line, either the whole tree or the flat list of its command leafs:
+#
+#	tree		{"ts":..,"tree":{"layer":"Hazil","commands":[{"command":"ReliableData","props":{..},"layers":[..]}]}}
+#	commands	{"ts":..,"commands":[{"path":"Hazil/ReliableData/InnerNet/GameData","props":{..}}, ..]}
+#
+# Decoded props are never text, so bytes (names, chat, data blobs, extranious) are written as base64 (or hex)
+# strings and load() turns every string in props and "extra" back into bytes.
+# Lines are encoded into a batch and written to the binary stream in one call per batch.
+
+ENCODERS = {
+    'base64': lambda value: base64.b64encode(value).decode('ascii'),
+    'hex': lambda value: value.hex(),
+}
+DECODERS = {
+    'base64': base64.b64decode,
+    'hex': binascii.unhexlify,
+}
+
+
+def _props(props, fields):
+    if fields is None:
+        return dict(props)
+    return {name: props[name] for name in props if name in fields}
+
+
+def _command(leaf, fields, path=None):
+    record = {'command': leaf.commandName} if path is None else {'path': path + leaf.commandName}
+    record['props'] = _props(leaf.props, fields)
+    if leaf.extranious:
+        record['extra'] = leaf.extranious
+    return record
+
+
+def tree_record(layer, fields=None):  # Nested dict of a layer, its command leafs and the layers they carried
+    record = {'layer': layer.name, 'commands': []}
+    if layer.errorFlag:
+        record['error'] = True
+    entries = {}
+    for child in layer.children:
+        if isinstance(child, commandLeaf):
+            entries[child] = entry = _command(child, fields)
+            record['commands'].append(entry)
+        else:
+            owner = entries.get(layer.commandLeafs.get(child))
+            if owner is not None:
+                owner.setdefault('layers', []).append(tree_record(child, fields))
+    return record
+
+
+def command_records(tree, fields=None):  # Flat list of every command leaf in packet order, with the path down to it
+    records = []
+    stack = [(tree, tree.name + '/', iter(tree.children))]
+    while stack:
+        layer, prefix, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+        elif isinstance(child, commandLeaf):
+            records.append(_command(child, fields, prefix))
+        else:  # Descend right away, the layer belongs to the leaf just before it
+            leaf = layer.commandLeafs.get(child)
+            path = prefix + (leaf.commandName if leaf else '?') + '/' + child.name + '/'
+            stack.append((child, path, iter(child.children)))
+    return records
+
+
+class JsonLinesDumper:
+    def __init__(self, stream, mode='tree', fields=None, batch_size=512, bytes_encoding='base64'):
+        if mode not in ('tree', 'commands'):
+            raise ValueError("mode must be 'tree' or 'commands'")
+        self.stream = stream  # Any binary stream, ideally buffered
+        self.mode = mode
+        self.fields = frozenset(fields) if fields is not None else None  # Prop names to keep, None keeps all
+        self.batchSize = batch_size
+        self.encodeBytes = ENCODERS[bytes_encoding]
+        self.encoder = json.JSONEncoder(separators=(',', ':'), default=self._default)
+        self.batch = []
+        self.written = 0
+
+    def _default(self, value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return self.encodeBytes(bytes(value))
+        raise TypeError("Cannot serialise %r" % type(value))
+
+    def dump(self, tree, ts=None):
+        line = {'ts': ts} if ts is not None else {}
+        if self.mode == 'tree':
+            line['tree'] = tree_record(tree, self.fields)
+        else:
+            line['commands'] = command_records(tree, self.fields)
+        self.batch.append(self.encoder.encode(line))
+        if len(self.batch) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.stream.write(('\n'.join(self.batch) + '\n').encode('utf-8'))
+            self.written += len(self.batch)
+            self.batch = []
+
+    def close(self):
+        self.flush()
+        self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+def _decode_command(record, decode):
+    record['props'] = {name: decode(value) if isinstance(value, str) else value
+                       for name, value in record['props'].items()}
+    if 'extra' in record:
+        record['extra'] = decode(record['extra'])
+    for layer in record.get('layers', []):
+        _decode_layer(layer, decode)
+
+
+def _decode_layer(layer, decode):
+    for command in layer['commands']:
+        _decode_command(command, decode)
+
+
+def load(stream, bytes_encoding='base64'):  # Iterates the lines of a dump with bytes restored
+    decode = DECODERS[bytes_encoding]
+    for line in stream:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if 'tree' in record:
+            _decode_layer(record['tree'], decode)
+        for command in record.get('commands', []):
+            _decode_command(command, decode)
+        yield record
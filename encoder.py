@@ -0,0 +1,155 @@
+import struct
+from collections import namedtuple
+
+from . import layers
+
+# Packet encoder, the reverse of layerBase.parse
+#
+# A packet is described as a tree of Msg, each one a command on a layer with its props and the messages for the
+# layer its command hands the rest of the payload to. Layers can be given as classes or by their printable name.
+#
+#	Msg(hazilLayer, 'ReliableData', {'seq': 1}, [
+#		Msg(innerLayer, 'GameData', {'gameId': 32}, [...])])
+#
+# The command tables in layers.py are compiled once per (layer, command) into a plan of precompiled structs, and
+# every packet is written into one reused bytearray. Size fields are reserved and filled in once the body is known.
+
+Msg = namedtuple('Msg', ['layer', 'command', 'props', 'children'])
+
+LAYER_CLASSES = [layers.hazilLayer, layers.innerLayer, layers.gameDataLayer, layers.rpcLayer,
+                 layers.UpdateGameDataLayer, layers.GetGameListV2Layer, layers.LobbyItemLayer,
+                 layers.gameSettingsLayer, layers.spawnLayer, layers.spawnSubcommandLayer]
+
+SPECIAL_FIELDS = ['s', 'P', 'p', '?', 'X']
+
+
+def msg(layer, command, props=None, children=()):
+    return Msg(layer, command, props or {}, list(children))
+
+
+_layers = {}
+
+
+def layer_info(layer_cls):  # A parked instance of the layer, only used for its settings and command table
+    if layer_cls not in _layers:
+        _layers[layer_cls] = layer_cls(None)
+    return _layers[layer_cls]
+
+
+LAYERS_BY_NAME = {layer_info(layer_cls).name: layer_cls for layer_cls in LAYER_CLASSES}
+
+
+def field_kinds(structure):  # Field type characters in the order structUnpack yields them
+    kinds = []
+    if structure is False:
+        return kinds
+    for segment in structure.split('|'):
+        if segment and segment[0] in SPECIAL_FIELDS:
+            kinds.append(segment[0])
+            segment = segment[1:]
+        kinds.extend(segment)
+    return kinds
+
+
+def write_packed(out, value):  # Hazel packed int, same bytes as helpers.packInt
+    while value >= 128:
+        out.append((value & 127) | 128)
+        value >>= 7
+    out.append(value)
+
+
+Plan = namedtuple('Plan', ['commandByte', 'before', 'size', 'fields'])
+
+
+def _compile_fields(kinds, names, order):  # [(kind, Struct, names)] with runs of plain struct fields merged
+    ops = []
+    run_format, run_names = '', []
+    for kind, name in zip(kinds, names):
+        if kind in SPECIAL_FIELDS:
+            if run_names:
+                ops.append(('struct', struct.Struct(order + run_format), run_names))
+                run_format, run_names = '', []
+            if kind != 'X':  # X is written before the size field
+                ops.append((kind, None, name))
+        else:
+            run_format += kind
+            run_names.append(name)
+    if run_names:
+        ops.append(('struct', struct.Struct(order + run_format), run_names))
+    return ops
+
+
+def compile_plan(layer_cls, command):
+    layer = layer_info(layer_cls)
+    command_id, structure, arg_names, child_handler = layer.commands()[command]
+    kinds = field_kinds(structure)
+    before = []
+    if layer.fieldBeforeSize and 'X' in kinds:
+        x_name = arg_names[kinds.index('X')]
+        before = _compile_fields(field_kinds(layer.fieldBeforeSize), [x_name], layer.order)
+    return Plan(command_id if layer.pullCommandByte else None, before,
+                struct.Struct(layer.sizeField) if layer.sizeField else None,
+                _compile_fields(kinds, arg_names, layer.order))
+
+
+class Encoder:
+    def __init__(self):
+        self.plans = {}  # (layer class, command) -> Plan
+        self.buffer = bytearray()
+
+    def plan(self, layer, command):
+        key = (layer, command)
+        plan = self.plans.get(key)
+        if plan is None:
+            layer_cls = LAYERS_BY_NAME[layer] if isinstance(layer, str) else layer
+            plan = self.plans[key] = compile_plan(layer_cls, command)
+        return plan
+
+    def encode(self, message):  # Bytes of a whole message tree
+        buffer = self.buffer
+        del buffer[:]
+        self.write(message, buffer)
+        return bytes(buffer)
+
+    def write(self, message, out):  # Appends the encoded message to a bytearray
+        plan = self.plans.get((message.layer, message.command)) or self.plan(message.layer, message.command)
+        props = message.props
+        if plan.before:
+            self._write_fields(plan.before, props, out)
+        if plan.size is not None:
+            size_at = len(out)
+            out += bytes(plan.size.size)
+        start = len(out)
+        if plan.commandByte is not None:
+            out.append(plan.commandByte)
+        self._write_fields(plan.fields, props, out)
+        for child in message.children:
+            self.write(child, out)
+        if plan.size is not None:
+            plan.size.pack_into(out, size_at, len(out) - start - 1)  # Size does not count the command byte
+
+    @staticmethod
+    def _write_fields(fields, props, out):
+        for kind, packer, name in fields:
+            if packer is not None:
+                out += packer.pack(*[props[field] for field in name])
+            elif kind == 'p':
+                write_packed(out, props[name])
+            elif kind == 's':
+                value = props[name]
+                out.append(len(value))
+                out += value
+            elif kind == 'P':
+                values = props[name]
+                out.append(len(values))
+                for value in values:
+                    write_packed(out, value)
+            elif kind == '?':
+                out += props[name]
+
+
+_default = Encoder()
+
+
+def encode(message):
+    return _default.encode(message)
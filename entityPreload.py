@@ -0,0 +1,98 @@
+from collections import namedtuple, deque, OrderedDict
+from typing import Union, Any
+
+# Buffer for RPCs sent to entities before they have spawned
+#
+# Only a detached record of the command is kept, never the parse tree node, so a buffered command does not hold
+# its whole packet alive. Records are bounded per entity, in total, and by age (in engine time units).
+# Eviction is oldest record first across all entities. One deque holds (record, netId) in the order records were
+# buffered, entries whose record already left through take() or the per entity limit are skipped when reached.
+
+PreloadRecord = namedtuple('PreloadRecord', ['time', 'commandName', 'props'])
+
+DEFAULT_MAX_PER_ENTITY = 32
+DEFAULT_MAX_TOTAL = 1024
+DEFAULT_MAX_AGE = 300
+
+
+class EntityPreloadBuffer:
+    def __init__(self, max_per_entity=DEFAULT_MAX_PER_ENTITY, max_total=DEFAULT_MAX_TOTAL, max_age=DEFAULT_MAX_AGE):
+        self.maxPerEntity: int = max_per_entity
+        self.maxTotal: int = max_total
+        self.maxAge: Union[bool, Any] = max_age  # None or False disables age eviction
+
+        self.entities: OrderedDict = OrderedDict()  # netId -> deque of PreloadRecord, in order of first buffering
+        self.order = deque()  # (PreloadRecord, netId) of every buffered record, oldest first
+        self.size: int = 0  # Records currently held
+        self.evictions: int = 0  # Records dropped by any of the limits since creation
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, net_id):
+        return net_id in self.entities
+
+    def add(self, net_id, time, command_name, props):
+        self.expire(time)
+
+        records = self.entities.get(net_id)
+        if records is None:
+            records = self.entities[net_id] = deque()
+        elif len(records) >= self.maxPerEntity:
+            records.popleft()
+            self.size -= 1
+            self.evictions += 1
+
+        record = PreloadRecord(time, command_name, props)
+        records.append(record)
+        self.order.append((record, net_id))
+        self.size += 1
+
+        while self.size > self.maxTotal:
+            self._evict_oldest()
+        if len(self.order) > 2 * self.size + 64:
+            self._compact()
+
+    def take(self, net_id):  # Remove and return the records held for an entity, oldest first
+        records = self.entities.pop(net_id, None)
+        if not records:
+            return []
+        self.size -= len(records)
+        return list(records)
+
+    def expire(self, now):
+        if not self.maxAge or not self.entities:
+            return
+        cutoff = now - self.maxAge
+        while self._live_head() and self.order[0][0].time < cutoff:
+            self._evict_oldest()
+
+    def clear(self):  # Drops everything without counting it as evicted
+        self.entities.clear()
+        self.order.clear()
+        self.size = 0
+
+    def _live_head(self):  # Drops order entries of records already taken or dropped, True if a held record is left
+        order = self.order
+        while order:
+            record, net_id = order[0]
+            records = self.entities.get(net_id)
+            if records and records[0] is record:
+                return True
+            order.popleft()
+        return False
+
+    def _evict_oldest(self):
+        if not self._live_head():
+            return
+        record, net_id = self.order.popleft()
+        records = self.entities[net_id]
+        records.popleft()
+        self.size -= 1
+        self.evictions += 1
+        if not records:
+            del self.entities[net_id]
+
+    def _compact(self):  # Drops order entries of records that are no longer held
+        held = {id(record) for records in self.entities.values() for record in records}
+        self.order = deque(entry for entry in self.order if id(entry[0]) in held)
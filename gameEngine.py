@@ -1,11 +1,18 @@
 __version__ = "0.0.1"
 
-from . import parse
+from . import parse, instrumentation
 from .layers import commandLeaf, hazilLayer, innerLayer, gameDataLayer, rpcLayer, spawnLayer, spawnSubcommandLayer, \
     UpdateGameDataLayer
 from .helpers import flatten
+from .entityPreload import EntityPreloadBuffer
+from .spawnDecoders import decode_player_control, decode_game_data_players, SHIP_LAYOUTS
+from .systemState import ShipStatusState, MeetingHudState, DECODE_ERRORS
+from .netQuality import NetworkTracker
+from .validation import Validator
+from .eventBus import EventBus
 
 import struct
+import time
 from typing import Union, Any, Dict, List
 
 
@@ -47,8 +54,8 @@ class PlayerClass:
     def __setstate__(self, state):
         self.__dict__.update(state)
 
-    def callback(self, callback_name):  # Convenience function to shorten callback updates
-        self.game_state.callback(callback_name, {'gameState': self.game_state, 'player': self})
+    def callback(self, callback_name, changed=True):  # Convenience function to shorten callback updates
+        self.game_state.emit(callback_name, self, changed, catch_all=False)
 
     def snap_to(self, ix, iy, seq):
         if seq > self.lastMoveSeq:
@@ -83,7 +90,9 @@ class PlayerClass:
         return False, False
 
     def vent(self, in_vent: bool):
+        changed = self.in_vent != in_vent
         self.in_vent = in_vent
+        self.callback("Vent", changed)
 
     def exiled(self):
         self.alive = False
@@ -98,24 +107,29 @@ class PlayerClass:
         player.murdered()
 
     def set_skin(self, skin_id):
+        changed = self.skin != skin_id
         self.skin = skin_id
-        self.callback("SetSkin")
+        self.callback("SetSkin", changed)
 
     def set_hat(self, hat_id):
+        changed = self.hat != hat_id
         self.hat = hat_id
-        self.callback("SetHat")
+        self.callback("SetHat", changed)
 
     def set_pet(self, pet_id):
+        changed = self.pet != pet_id
         self.pet = pet_id
-        self.callback("SetPet")
+        self.callback("SetPet", changed)
 
     def set_color(self, color_id):
+        changed = self.color != color_id
         self.color = color_id
-        self.callback("SetColor")
+        self.callback("SetColor", changed)
 
     def set_infected(self, is_infected):
+        changed = self.infected != is_infected
         self.infected = is_infected
-        self.callback("Infected")
+        self.callback("Infected", changed)
 
     def assign_id(self, player_id):
         self.playerId = player_id
@@ -128,14 +142,15 @@ class PlayerClass:
             pass
 
     def chat(self, message):
-        self.game_state.callback('Chat', {'gameState': self.game_state, 'player': self, 'message': message})
+        self.game_state.emit('Chat', self, catch_all=False, message=message)
 
     def set_username_from_list(self, name):
         self.set_name(name)
 
     def set_name(self, name):
+        changed = self.name != name
         self.name = name
-        self.callback("SetName")
+        self.callback("SetName", changed)
 
     def add_entity(self, entity):
         if entity.netId not in self.entities:
@@ -158,33 +173,101 @@ class EntityClass:
 
 # noinspection PyAttributeOutsideInit,PyUnresolvedReferences
 class GameEngine:
-    def __init__(self, callback_dict=None):
+    # RPCs that need a spawned player, only these are worth keeping for entities that have not spawned yet
+    PRELOAD_COMMANDS = frozenset(["EnterVent", "ExitVent", "SnapTo", "MurderPlayer", "SetName", "SetSkin", "SetHat",
+                                  "SetColor", "SetPet", "SetInfected", "SendChat"])
+
+    def __init__(self, callback_dict=None, preload_buffer=None):
         self.callbackDict = callback_dict if callback_dict is not None else {}  # Will not reset with game state
+        # Bounded buffer of commands sent to entities before they spawned, limits and eviction count survive resets
+        self.entityPreload: EntityPreloadBuffer = preload_buffer if preload_buffer is not None else EntityPreloadBuffer()
+        self.procListeners: List[Any] = []  # Called with the engine after every proc(), will not reset with game state
+        self.events: EventBus = EventBus()  # Filtered subscriptions next to callbackDict, will not reset with game state
+        self.networkTracker: Union[bool, Any] = None  # Set by track_network(), will not reset with game state
+        self.validator: Union[bool, Any] = None  # Set by validate_packets(), will not reset with game state
+        self.systemDecodeErrors: int = 0  # ShipStatus / MeetingHud blobs that failed to decode, will not reset
+        self.flow: Any = None  # Flow and direction of the packet being processed
+        self.fromServer: Union[bool, Any] = None
         self.reset()
 
     def __getstate__(self):
         state = self.__dict__.copy()
         if "callbackDict" in state:
             del state["callbackDict"]
+        if "procListeners" in state:
+            del state["procListeners"]
+        if "events" in state:
+            del state["events"]
         return state
 
     def __setstate__(self, state):
         self.__dict__.update(state)
+        self.__dict__.setdefault("procListeners", [])
+        self.__dict__.setdefault("events", EventBus())
 
-    def callback(self, name, data_dict):
-        try:
-            cb = self.callbackDict[name]
-        except:
-            cb = False
-            pass  # Callback not registered
-        if cb:
+    def track_network(self, tracker=None):  # Start matching Hazel sends to their acks, see netQuality
+        self.networkTracker = tracker if tracker is not None else NetworkTracker()
+        return self.networkTracker
+
+    def network_stats(self, flow=None):
+        if self.networkTracker is None:
+            return None
+        return self.networkTracker.stats(flow)
+
+    def validate_packets(self, validator=None):  # Drop packets with broken framing before parsing, see validation
+        self.validator = validator if validator is not None else Validator()
+        return self.validator
+
+    def add_proc_listener(self, listener):  # listener(engine) runs once the whole packet has been applied
+        if listener not in self.procListeners:
+            self.procListeners.append(listener)
+
+    def remove_proc_listener(self, listener):
+        if listener in self.procListeners:
+            self.procListeners.remove(listener)
+
+    def subscribe(self, handler, events=None, **filters):  # handler(name, payload), see eventBus for the filters
+        return self.events.subscribe(handler, events, **filters)
+
+    def unsubscribe(self, subscription):
+        self.events.unsubscribe(subscription)
+
+    def run_callback(self, name, cb, data_dict):
+        stats = instrumentation.collector
+        if stats is None:
             # noinspection PyCallingNonCallable
             cb(data_dict)
+        else:
+            start = time.perf_counter()
+            cb(data_dict)
+            stats.record_callback(name, time.perf_counter() - start)
 
-    def ge_callback(self, name, player=None):  # Convenience function for game state update callbacks
-        if name != 'Reset':
-            self.callback('Event', {'gameState': self, 'player': player})
-        self.callback(name, {'gameState': self, 'player': player})
+    def callback(self, name, data_dict):  # Runs the registered callback and subscribers with a ready made payload
+        cb = self.callbackDict.get(name)
+        if cb:
+            self.run_callback(name, cb, data_dict)
+        subscriptions = self.events.subscribers(name)
+        if subscriptions is not None:
+            self.events.publish(subscriptions, name, self, data_dict.get('player'), True, lambda: data_dict)
+
+    def emit(self, name, player=None, changed=True, catch_all=True, **extra):  # Payload is only built if needed
+        cb = self.callbackDict.get(name)
+        event_cb = self.callbackDict.get('Event') if catch_all else None
+        subscriptions = self.events.subscribers(name)
+        if cb or event_cb:
+            data_dict = {'gameState': self, 'player': player, **extra}
+            if event_cb:
+                self.run_callback('Event', event_cb, data_dict)
+            if cb:
+                self.run_callback(name, cb, data_dict)
+            if subscriptions is not None:
+                self.events.publish(subscriptions, name, self, player, changed, lambda: data_dict)
+        elif subscriptions is not None:  # Built only if a subscription gets past its filters
+            self.events.publish(subscriptions, name, self, player, changed,
+                                lambda: {'gameState': self, 'player': player, **extra})
+
+    def ge_callback(self, name, player=None, **extra):  # Convenience function for game state update callbacks
+        self.emit(name, player, catch_all=name != 'Reset', **extra)
 
     def reset(self):
         self.gameId: Union[bool, Any] = False
@@ -206,25 +289,41 @@ class GameEngine:
         self.meetingStartedAt: Union[bool, Any] = False  # Time it started at
         self.meetingReason: Union[bool, Any] = False  # Will be "Button" or the entity of a murdered player
 
-        self.entityPreload: Dict[Any] = {}  # A dict of entities that had data sent to them before proper instantiation
+        self.entityPreload.clear()  # Commands sent to entities before proper instantiation
 
         self.gameSettings: Dict[Any] = {}
 
         self.lobbyEntity: Union[bool, Any] = False
+        self.systemEntities: Dict[Any] = {}  # ShipStatus / MeetingHud state by net id, updated from Data deltas
 
         self.ge_callback('Reset')
 
     def register_player_id(self, player, player_id):
         self.playerIdMap[player_id] = player
 
-    def proc(self, data, ts):
+    def proc(self, data, ts, flow=None, from_server=None):  # False if the validator rejected the packet, True otherwise
+        if self.validator is not None and self.validator.check(data) is not None:
+            return False  # Rejected packets leave the engine untouched
         self.time = ts
+        self.flow = flow
+        self.fromServer = from_server
         self.tick += 1
         tree = parse(data)
         nodes = []
         flatten(tree, nodes)  # Flatten the tree into the nodes
+        stats = instrumentation.collector
         for node in nodes:  # Process each node individually, can always traverse if needed
-            self.proc_node(node)
+            if stats is None or not isinstance(node, commandLeaf):
+                self.proc_node(node)
+            else:  # Callbacks are timed on their own, leave them out of the handler
+                callback_seconds = stats.callbackSeconds
+                start = time.perf_counter()
+                self.proc_node(node)
+                elapsed = time.perf_counter() - start - (stats.callbackSeconds - callback_seconds)
+                stats.record_handler(node.parent.name, node.commandName, elapsed)
+        for listener in self.procListeners:
+            listener(self)
+        return True
 
     def create_player(self, client_id):
         player = PlayerClass(self)
@@ -278,6 +377,70 @@ class GameEngine:
             net_id = command_node.props["netId"]
         self.lastSpawnedId = command_node.props["netId"]
 
+    def proc_player_rpc(self, player, command_name, props):
+        #
+        # We need a player object for these commands to make sense
+        #
+
+        if command_name == "EnterVent":
+            player.vent(True)
+        if command_name == "ExitVent":
+            player.vent(False)
+
+        if command_name == "SnapTo":
+            player.snap_to(props.x, props.y, props.seq)
+
+        if command_name == "MurderPlayer":
+            murdered_net_id = props["netId"]
+            if murdered_net_id not in self.entities:
+                return
+            murdered_entity = self.entities[murdered_net_id]
+            murdered_player = murdered_entity.owner
+            player.murder(murdered_player)  # Do the murder
+
+        if command_name == "SetName":
+            player.set_name(props["name"])
+        if command_name == "SetSkin":
+            player.set_skin(props['id'])
+        if command_name == "SetHat":
+            player.set_hat(props['id'])
+        if command_name == "SetColor":
+            player.set_color(props['id'])
+        if command_name == "SetPet":
+            player.set_pet(props['id'])
+
+        if command_name == "SetInfected":
+            for player_id in props['playerIdList']:
+                if player_id in self.playerIdMap:
+                    self.playerIdMap[player_id].set_infected(True)
+
+        if command_name == "SendChat":
+            message = props["message"]
+            player.chat(message)
+
+    def system_decode_failed(self, net_id, name, error):  # Stop tracking an object whose blobs we cannot read
+        self.systemEntities.pop(net_id, None)
+        self.systemDecodeErrors += 1
+        stats = instrumentation.collector
+        if stats is not None:
+            stats.record_error('Engine', name, type(error).__name__)
+
+    def proc_system_data(self, system_entity, data):
+        try:
+            changes = system_entity.apply(data)
+        except DECODE_ERRORS as error:
+            name = system_entity.spawnName if isinstance(system_entity, ShipStatusState) else "MeetingHud"
+            self.system_decode_failed(system_entity.netId, name, error)
+            return
+        if isinstance(system_entity, ShipStatusState):
+            for change in changes:
+                self.ge_callback('SystemUpdate', system=change.system, field=change.field,
+                                 previous=change.previous, value=change.value)
+        else:
+            for change in changes:
+                self.ge_callback('VoteUpdate', player=self.playerIdMap.get(change.playerId), index=change.index,
+                                 previous=change.previous, value=change.value)
+
     def proc_node(self, command_node):
         if isinstance(command_node, commandLeaf):  # Process command leafs and traverse upward for data where needed
             parent_node = command_node.parent
@@ -285,6 +448,9 @@ class GameEngine:
             if isinstance(parent_node, hazilLayer):
                 if command_node.commandName == "Hello":
                     pass
+                if self.networkTracker is not None:
+                    self.networkTracker.observe(self.flow, self.fromServer, command_node.commandName,
+                                                command_node.props, self.time)
             # Inner Net
             if isinstance(parent_node, innerLayer):
                 if command_node.commandName == "RemovePlayer":
@@ -309,8 +475,8 @@ class GameEngine:
 
             # Game Data  Layer
             if isinstance(parent_node, gameDataLayer):
-                if command_node.commandName == "Data":
-                    owner_id = command_node.props["ownerId"]
+                if command_node.commandName == "Data":  # Movement, the hottest path, reads props by position
+                    owner_id = command_node.props.ownerId
                     try:
                         entity = self.entities[owner_id]
                         player = entity.owner
@@ -318,13 +484,18 @@ class GameEngine:
                         player = False
                     if player:
                         if owner_id == player.networkTransformNetId:  ## Data addressed to player move handler!
-                            player.parse_location(command_node.props["data"])
+                            player.parse_location(command_node.props.data)
                             self.ge_callback('PlayerMovement', player=player)
+                    elif owner_id in self.systemEntities:  ## Dirty bit delta for a ship or meeting object
+                        self.proc_system_data(self.systemEntities[owner_id], command_node.props.data)
+
+                if command_node.commandName == "Despawn":
+                    self.systemEntities.pop(command_node.props["netId"], None)
 
             # RPC
             if isinstance(parent_node, rpcLayer):
-                parent_command_node = parent_node.parent.commandLeafs[parent_node]
-                owner_id = parent_command_node.props["ownerId"]
+                parent_command_node = command_node.parentCommand()
+                owner_id = parent_command_node.props.ownerId
                 try:
                     entity = self.entities[owner_id]
                     player: Union[bool, Any] = entity.owner
@@ -337,7 +508,7 @@ class GameEngine:
                 #
 
                 if command_node.commandName == "SyncSettings":  # Set game settings (no player needed)
-                    self.gameSettings = parent_node.children[1].children[0].props
+                    self.gameSettings = command_node.childCommands()[0].props.asdict()  # Public, keep it a real dict
                     self.ge_callback('GameSettings')
 
                 if command_node.commandName == "StartMeeting":  # meeting just started, players have been moved
@@ -345,7 +516,7 @@ class GameEngine:
                     if parent_command_node.props["ownerId"] in self.entities:
                         self.meetingStartedBy = self.entities[parent_command_node.props["ownerId"]].owner
                     self.meetingStartedAt = self.time
-                    report_id = parent_node.children[0].props["playerId"]
+                    report_id = command_node.props["playerId"]
                     self.meetingReason = "Button" if report_id == 255 else report_id
                     self.ge_callback('StartMeeting')
 
@@ -368,53 +539,11 @@ class GameEngine:
                         exile_player.exiled()
 
                 if not player:  # If we don't have a player instantiated yet
-                    try:
-                        self.entityPreload[owner_id]  # Check if we have established a preload for this entity
-                    except:
-                        self.entityPreload[owner_id] = []  # Establish one if not
-                    self.entityPreload[owner_id].append(
-                        command_node)  # Save command, We will rerun these commands if we see the entity spawn
-
-                #
-                # We need a player object for these commands to make sense
-                #
-
-                if player:
-                    if command_node.commandName == "EnterVent":
-                        player.vent(True)
-                    if command_node.commandName == "ExitVent":
-                        player.vent(False)
-
-                    if command_node.commandName == "SnapTo":
-                        player.snap_to(command_node.props["x"], command_node.props["y"], command_node.props["seq"])
-
-                    if command_node.commandName == "MurderPlayer":
-                        murdered_net_id = command_node.props["netId"]
-                        if murdered_net_id not in self.entities:
-                            return
-                        murdered_entity = self.entities[murdered_net_id]
-                        murdered_player = murdered_entity.owner
-                        player.murder(murdered_player)  # Do the murder
-
-                    if command_node.commandName == "SetName":
-                        player.set_name(command_node.props["name"])
-                    if command_node.commandName == "SetSkin":
-                        player.set_skin(command_node.props['id'])
-                    if command_node.commandName == "SetHat":
-                        player.set_hat(command_node.props['id'])
-                    if command_node.commandName == "SetColor":
-                        player.set_color(command_node.props['id'])
-                    if command_node.commandName == "SetPet":
-                        player.set_pet(command_node.props['id'])
-
-                    if command_node.commandName == "SetInfected":
-                        for player_id in command_node.props['playerIdList']:
-                            if player_id in self.playerIdMap:
-                                self.playerIdMap[player_id].set_infected(True)
-
-                    if command_node.commandName == "SendChat":
-                        message = command_node.props["message"]
-                        player.chat(message)
+                    if command_node.commandName in self.PRELOAD_COMMANDS:
+                        # Save a detached copy, We will rerun these commands if we see the entity spawn
+                        self.entityPreload.add(owner_id, self.time, command_node.commandName, command_node.props)
+                else:
+                    self.proc_player_rpc(player, command_node.commandName, command_node.props)
 
             # Game data style player update
             if isinstance(parent_node, UpdateGameDataLayer):
@@ -435,19 +564,19 @@ class GameEngine:
             if isinstance(parent_node, spawnLayer):
                 if command_node.commandName == "Lobby":
                     if not self.lobbyEntity:
-                        self.lobbyEntity = parent_node.children[1].children[0].props['netId']
+                        self.lobbyEntity = command_node.childCommands()[0].props['netId']
                     else:
                         pass  # Happens when we read our own fake lobby spawns
                 if command_node.commandName == "Player":
                     # Player spawn
-                    for child in parent_node.children[1].children:
+                    for child in command_node.childCommands():
                         self.spawn_entity(command_node, child)
                     # Player will exist at this point
                     player = self.players[command_node.props["clientId"]]
-                    player_control, player_physics, network_transform = parent_node.children[1].children
+                    player_control, player_physics, network_transform = command_node.childCommands()
 
                     # Pull out the player id from the data sent on the player control spawn
-                    u1, player_id = struct.unpack("BB", player_control.props['data'])
+                    player_id = decode_player_control(player_control.props['data']).playerId
                     player.assign_id(player_id)
 
                     # Store the network id's of the player entities
@@ -460,37 +589,37 @@ class GameEngine:
                     # We keep these and rerun them when the spawn happens
 
                     for netId in [player.playerControlNetId, player.playerPhysicsNetId, player.networkTransformNetId]:
-                        try:
-                            commands = self.entityPreload[netId]
-                            del self.entityPreload[netId]  # Remove the preload commands from the registry
-                        except:
-                            commands = []
-                        for rerunNode in commands:
-                            self.proc_node(rerunNode)  # Rerun the commands sent before spawn
+                        for record in self.entityPreload.take(netId):  # Removes the preload commands from the buffer
+                            self.proc_player_rpc(player, record.commandName, record.props)  # Rerun the commands sent before spawn
 
                 if command_node.commandName == "GameData":
-                    for child in parent_node.children[1].children:
+                    for child in command_node.childCommands():
                         self.spawn_entity(command_node, child)
-                    a1, a2 = parent_node.children[1].children  # Arguments 1 and 2? (guessing at what to call it)
+                    a1, a2 = command_node.childCommands()  # Arguments 1 and 2? (guessing at what to call it)
                     self.gameDataEntities = [a1.props['netId'], a2.props['netId']]
-                    user_count = a1.props['data'][0]
-                    buffer = a1.props['data'][1:]
-                    for i in range(user_count):
-                        player_id = buffer[0]
-                        buffer = buffer[1:]
-                        slen = buffer[0]
-                        buffer = buffer[1:]
-                        user_name = buffer[0:slen]
-                        buffer = buffer[slen:]
-                        u1, u2 = struct.unpack("<LH", buffer[0:6])
-                        buffer = buffer[6:]
-                        self.usernameLookup[player_id] = user_name
-                        for clientId in self.players.keys():
-                            player = self.players[clientId]
-                            if player.playerId == player_id:
-                                player.set_username_from_list(user_name)
+                    for info in decode_game_data_players(a1.props['data']):
+                        self.usernameLookup[info.playerId] = info.name
+                        player = self.playerIdMap.get(info.playerId)
+                        if player:
+                            player.set_username_from_list(info.name)
+                if command_node.commandName in SHIP_LAYOUTS and command_node.childCommands():
+                    ship_control = command_node.childCommands()[0]
+                    net_id = ship_control.props['netId']
+                    try:
+                        self.systemEntities[net_id] = ShipStatusState(net_id, command_node.commandName,
+                                                                      ship_control.props['data'])
+                    except DECODE_ERRORS as error:
+                        self.system_decode_failed(net_id, command_node.commandName, error)
+                if command_node.commandName == "MeetingHud" and command_node.childCommands():
+                    meeting_control = command_node.childCommands()[0]
+                    net_id = meeting_control.props['netId']
+                    try:
+                        self.systemEntities[net_id] = MeetingHudState(net_id, meeting_control.props['data'],
+                                                                      sorted(self.playerIdMap))
+                    except DECODE_ERRORS as error:
+                        self.system_decode_failed(net_id, "MeetingHud", error)
             if isinstance(parent_node, spawnSubcommandLayer):
                 pass  # DO NOT HANDLE HERE!!!
 
             if "gameId" in command_node.props:
-                self.gameId = command_node.props["gameId"]
+                self.gameId = command_node.props.gameId
@@ -22,11 +22,24 @@ def unpack(data):
 		shift += 7
 	return output, data[on:]
 
+def unpackFrom(data, offset): ## Same as unpack but reads at an offset and returns the new offset instead of slicing
+	shift = 0
+	output = 0
+	while True:
+		b = data[offset]
+		offset += 1
+		output |= (b & 127) << shift
+		shift += 7
+		if b < 128:
+			return output, offset
+
 def pack(data):
 	d = int.from_bytes(data, 'little')
 	return packInt(d)
 
 def packInt(d):
+	if d == 0:
+		return b'\x00' ## Zero still takes a byte on the wire
 	output = b''
 	while d > 0:
 		b = d & 255
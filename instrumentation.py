@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Opt in counters for the parser and the game engine
+#
+# Nothing is recorded until enable() is called. The parser and the engine only check whether collector is None,
+# so leaving instrumentation off costs one global lookup per layer parsed.
+#
+# Counters are keyed by (layer name, command name) for decoding and engine handlers, and by event name for
+# callbacks and event bus handlers. Handler time leaves out the callbacks run from it, so a slow subscriber shows
+# up under its event and not under the command that fired it. They can be read with stats().snapshot() or exported
+# as Prometheus text.
+
+collector = None
+
+
+class Stats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.packets = 0
+        self.packetBytes = 0
+        self.commands = {}  # (layer, command) -> [count, bytes, seconds]
+        self.errors = {}  # (layer, command, reason) -> count
+        self.handlers = {}  # (layer, command) -> [calls, seconds]
+        self.callbacks = {}  # event name -> [calls, seconds]
+        self.callbackSeconds = 0.0  # Total of every callback, taken off the handler that ran them
+
+    def record_packet(self, size):
+        self.packets += 1
+        self.packetBytes += size
+
+    def record_command(self, layer, command, size, seconds):
+        entry = self.commands.get((layer, command))
+        if entry is None:
+            entry = self.commands[(layer, command)] = [0, 0, 0.0]
+        entry[0] += 1
+        entry[1] += size
+        entry[2] += seconds
+
+    def record_error(self, layer, command, reason):
+        key = (layer, command, reason)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def record_handler(self, layer, command, seconds):
+        entry = self.handlers.get((layer, command))
+        if entry is None:
+            entry = self.handlers[(layer, command)] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def record_callback(self, name, seconds):
+        entry = self.callbacks.get(name)
+        if entry is None:
+            entry = self.callbacks[name] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        self.callbackSeconds += seconds
+
+    def snapshot(self):  # Plain dict copy of every counter, safe to hand to another thread
+        return {
+            'started': self.started,
+            'packets': self.packets,
+            'packetBytes': self.packetBytes,
+            'commands': {layer + '/' + command: {'count': count, 'bytes': size, 'seconds': seconds}
+                         for (layer, command), (count, size, seconds) in list(self.commands.items())},
+            'errors': {layer + '/' + command + '/' + reason: count
+                       for (layer, command, reason), count in list(self.errors.items())},
+            'handlers': {layer + '/' + command: {'calls': calls, 'seconds': seconds}
+                         for (layer, command), (calls, seconds) in list(self.handlers.items())},
+            'callbacks': {name: {'calls': calls, 'seconds': seconds}
+                          for name, (calls, seconds) in list(self.callbacks.items())},
+        }
+
+
+def enable():
+    global collector
+    if collector is None:
+        collector = Stats()
+    return collector
+
+
+def disable():  # Stops recording, the counters collected so far are returned
+    global collector
+    stats, collector = collector, None
+    return stats
+
+
+def stats():
+    return collector
+
+
+#
+# Prometheus text exposition
+#
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append('# HELP %s %s' % (name, help_text))
+    lines.append('# TYPE %s %s' % (name, kind))
+    for labels, value in samples:
+        if labels:
+            label_text = ','.join('%s="%s"' % (key, _label(label)) for key, label in labels)
+            lines.append('%s{%s} %s' % (name, label_text, repr(value)))
+        else:
+            lines.append('%s %s' % (name, repr(value)))
+
+
+def render_prometheus(source=None):
+    source = source if source is not None else collector
+    lines = []
+    if source is None:
+        return ''
+    commands = list(source.commands.items())
+    handlers = list(source.handlers.items())
+    callbacks = list(source.callbacks.items())
+
+    _metric(lines, 'amongus_parser_packets_total', 'counter', 'Packets handed to parse().',
+            [((), source.packets)])
+    _metric(lines, 'amongus_parser_packet_bytes_total', 'counter', 'Bytes handed to parse().',
+            [((), source.packetBytes)])
+    _metric(lines, 'amongus_parser_commands_total', 'counter', 'Commands decoded per layer and command.',
+            [((('layer', layer), ('command', command)), entry[0]) for (layer, command), entry in commands])
+    _metric(lines, 'amongus_parser_command_bytes_total', 'counter', 'Bytes consumed per layer and command.',
+            [((('layer', layer), ('command', command)), entry[1]) for (layer, command), entry in commands])
+    _metric(lines, 'amongus_parser_decode_seconds_total', 'counter', 'Time decoding each layer and command.',
+            [((('layer', layer), ('command', command)), entry[2]) for (layer, command), entry in commands])
+    _metric(lines, 'amongus_parser_errors_total', 'counter', 'Layers that failed to decode.',
+            [((('layer', layer), ('command', command), ('reason', reason)), count)
+             for (layer, command, reason), count in list(source.errors.items())])
+    _metric(lines, 'amongus_engine_handler_calls_total', 'counter', 'GameEngine.proc_node calls per command.',
+            [((('layer', layer), ('command', command)), entry[0]) for (layer, command), entry in handlers])
+    _metric(lines, 'amongus_engine_handler_seconds_total', 'counter', 'Time in GameEngine.proc_node per command.',
+            [((('layer', layer), ('command', command)), entry[1]) for (layer, command), entry in handlers])
+    _metric(lines, 'amongus_engine_callback_calls_total', 'counter', 'Callbacks and event bus handlers run per event.',
+            [((('event', name),), entry[0]) for name, entry in callbacks])
+    _metric(lines, 'amongus_engine_callback_seconds_total', 'counter', 'Time in callbacks and event bus handlers per event.',
+            [((('event', name),), entry[1]) for name, entry in callbacks])
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, source=None):  # Written to a temp file and renamed, for node_exporter textfile collectors
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as output:
+        output.write(render_prometheus(source))
+    os.replace(temp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes should not spam stderr
+
+
+def serve_prometheus(port=9464, host='127.0.0.1'):  # Serves the live counters in a daemon thread, call shutdown() to stop
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='amongus-metrics', daemon=True)
+    thread.start()
+    return server
@@ -1,3 +1,6 @@
+import collections.abc
+from keyword import iskeyword
+
 class payloadClass:
 	def __init__(self, value):
 		self.value = value
@@ -11,4 +14,123 @@ class payloadClass:
 		self.value = self.value[count:]
 		return output
 	def resetCounter(self):
-		self.counter = 0
\ No newline at end of file
+		self.counter = 0
+
+## Decoded props
+##
+## Every command leaf used to get its own props dict. Props are now tuples of the decoded values, one record class per
+## argNames layout shared by every command with those names. The class holds the name -> position map, so a record
+## costs no more than a tuple of its values and still reads like the dict it replaces: props["name"], "name" in props,
+## keys(), values(), items(), get() and iteration over the names. dict(props) or props.asdict() gives a plain dict back.
+## They are still tuples though: json.dumps(props) writes the field names as a list, isinstance(props, dict) is False
+## and props["name"] = value raises. Convert with asdict() first.
+##
+## props["name"] goes through a Python level __getitem__, hot paths read props.name instead, a positional accessor
+## generated for every field that is an identifier and does not shadow a method. "name" in props is a dict lookup.
+
+_tupleGet = tuple.__getitem__
+_tupleIter = tuple.__iter__
+
+try: ## The C accessor namedtuple fields use, reads the tuple slot without going through __getitem__
+	from _collections import _tuplegetter
+except ImportError:
+	_tuplegetter = lambda position, doc: property(lambda self: _tupleGet(self, position), doc=doc)
+
+class propsBase(tuple):
+	__slots__ = ()
+	fields = ()
+	positions = {}
+
+	def __getitem__(self, key):
+		return _tupleGet(self, self.positions[key])
+
+	def __contains__(self, key):
+		return key in self.positions
+
+	def __iter__(self):
+		return iter(self.fields)
+
+	def get(self, key, default=None):
+		position = self.positions.get(key)
+		if position is None:
+			return default
+		return _tupleGet(self, position)
+
+	def keys(self):
+		return self.fields
+
+	def values(self):
+		return tuple(_tupleIter(self))
+
+	def items(self):
+		return tuple(zip(self.fields, _tupleIter(self)))
+
+	def asdict(self): ## Plain dict of the fields, for JSON or editing
+		return dict(zip(self.fields, _tupleIter(self)))
+
+	def __eq__(self, other):
+		if isinstance(other, propsBase):
+			return self.fields == other.fields and tuple.__eq__(self, other)
+		if isinstance(other, dict):
+			return dict(self.items()) == other
+		return NotImplemented
+
+	def __ne__(self, other):
+		equal = self.__eq__(other)
+		return equal if equal is NotImplemented else not equal
+
+	__hash__ = tuple.__hash__
+
+	def __repr__(self):
+		return "{" + ", ".join("%r: %r" % item for item in self.items()) + "}"
+
+	def __reduce__(self): ## Record classes are generated, rebuild from the field names
+		return makeProps, (self.fields, tuple(_tupleIter(self)))
+
+collections.abc.Mapping.register(propsBase)
+
+_propsClasses = {}
+
+def propsClass(argNames): ## Record class for a command's argNames, created once per layout
+	fields = tuple(argNames)
+	cls = _propsClasses.get(fields)
+	if cls is None:
+		positions = {name: position for position, name in enumerate(fields)}
+		namespace = {
+			'__slots__': (),
+			'fields': fields,
+			'positions': positions,
+			'__contains__': positions.__contains__, ## Not a descriptor, "name" in props calls it with the name alone
+		}
+		for name, position in positions.items():
+			if name.isidentifier() and not iskeyword(name) and not hasattr(propsBase, name):
+				namespace[name] = _tuplegetter(position, name)
+		cls = _propsClasses[fields] = type("props", (propsBase,), namespace)
+	return cls
+
+def makeProps(fields, values):
+	return tuple.__new__(propsClass(fields), values)
+
+EMPTY_PROPS = makeProps((), ())
+
+
+## Interning of short byte strings
+##
+## Names, scene names and the like repeat in every spawn, update and lobby listing. Short values are shared through a
+## bounded table so the same name is held once, the table starts over once it is full.
+
+INTERN_MAX_LENGTH = 32
+INTERN_MAX_ENTRIES = 4096
+_interned = {}
+
+def internBytes(value):
+	if type(value) is not bytes: ## A memoryview kept in the table would pin its whole buffer
+		value = bytes(value)
+	if len(value) > INTERN_MAX_LENGTH:
+		return value
+	shared = _interned.get(value)
+	if shared is None:
+		if len(_interned) >= INTERN_MAX_ENTRIES:
+			_interned.clear()
+		_interned[value] = shared = value
+	return shared
@@ -0,0 +1,121 @@
+import heapq
+from collections import namedtuple, deque
+from typing import Any, Dict, List
+
+# Merging several captures of the same lobby into one packet stream
+#
+# Client side captures, the server mirror and captures from other clients each miss packets the others saw. Every
+# source is an iterable of (ts, data) or (ts, data, flow, from_server) in timestamp order, read lazily. A heap merge
+# pulls one record per source at a time, so memory does not grow with the length of the captures.
+#
+# A packet seen by more than one source is dropped after its first sighting. Packets are identified by the Hazel
+# seq of reliable packets (ReliableData, Hello, Ping) plus a hash of the payload, unreliable packets by the hash
+# alone, always together with the direction and the flow when the source gives one. Acks and Pings are byte for byte
+# the same between connections and directions, only the flow and direction tell them apart. Keys are forgotten once
+# they are older than the dedup window, which bounds both memory and the chance of two unrelated packets colliding.
+
+CaptureRecord = namedtuple('CaptureRecord', ['ts', 'data', 'flow', 'fromServer', 'source'])
+
+RELIABLE_COMMANDS = frozenset([1, 8, 12])  # Hazil commands carrying a big endian seq after the command byte
+DEDUP_WINDOW = 2.0  # Seconds
+MAX_DEDUP_ENTRIES = 65536
+
+
+def packet_key(data, flow=None, from_server=None):
+    seq = (data[1] << 8 | data[2]) if len(data) >= 3 and data[0] in RELIABLE_COMMANDS else None
+    return flow, from_server, seq, hash(bytes(data))
+
+
+def _records(source, index, offset):
+    for record in source:
+        if len(record) == 2:
+            ts, data = record
+            flow = from_server = None
+        else:
+            ts, data, flow, from_server = record[:4]
+        yield CaptureRecord(ts + offset, data, flow, from_server, index)
+
+
+class CaptureMerger:
+    def __init__(self, dedup_window=DEDUP_WINDOW, max_entries=MAX_DEDUP_ENTRIES, per_flow=True):
+        self.dedupWindow = dedup_window
+        self.maxEntries: int = max_entries
+        # Only packets of the same flow are duplicates. Turn off when sources name one connection differently,
+        # a client capture behind NAT and the server mirror for example
+        self.perFlow: bool = per_flow
+        self.sources: List[Any] = []  # (source, clock offset)
+        self.seen: Dict[Any, Any] = {}  # Packet key -> time it was first seen
+        self.expiry = deque()  # (time, key) in the order keys were added
+        self.read: List[int] = []  # Records pulled from each source
+        self.duplicates: List[int] = []  # Records of each source dropped as duplicates
+        self.merged: int = 0
+
+    def add_source(self, source, offset=0.0):  # offset is added to every timestamp, for captures with skewed clocks
+        self.sources.append((source, offset))
+        self.read.append(0)
+        self.duplicates.append(0)
+        return len(self.sources) - 1
+
+    def _expire(self, now):
+        horizon = now - self.dedupWindow
+        expiry = self.expiry
+        while expiry and (expiry[0][0] < horizon or len(expiry) > self.maxEntries):
+            ts, key = expiry.popleft()
+            if self.seen.get(key) == ts:
+                del self.seen[key]
+
+    def __iter__(self):
+        streams = [_records(source, index, offset) for index, (source, offset) in enumerate(self.sources)]
+        for record in heapq.merge(*streams, key=lambda record: record.ts):
+            self.read[record.source] += 1
+            self._expire(record.ts)
+            key = packet_key(record.data, record.flow if self.perFlow else None, record.fromServer)
+            if key in self.seen:
+                self.duplicates[record.source] += 1
+                continue
+            self.seen[key] = record.ts
+            self.expiry.append((record.ts, key))
+            self.merged += 1
+            yield record
+
+    def feed(self, engine):  # Runs the merged stream through a GameEngine, returns the number of packets fed
+        fed = 0
+        for record in self:
+            engine.proc(record.data, record.ts, record.flow, record.fromServer)
+            fed += 1
+        return fed
+
+    def stats(self):
+        return {
+            'merged': self.merged,
+            'read': list(self.read),
+            'duplicates': list(self.duplicates),
+            'dedupEntries': len(self.seen),
+        }
+
+
+def merge_captures(*sources, **options):  # Merged, deduplicated records of every source
+    merger = CaptureMerger(**options)
+    for source in sources:
+        merger.add_source(source)
+    return iter(merger)
+
+
+def pcap_source(path, server_port=22023):  # Streams the Among Us UDP payloads of a pcap, needs scapy
+    from scapy.utils import PcapReader
+    from scapy.layers.inet import IP, UDP
+
+    with PcapReader(path) as reader:
+        for packet in reader:
+            if UDP not in packet or IP not in packet:
+                continue
+            udp = packet[UDP]
+            from_server = udp.sport == server_port
+            if not from_server and udp.dport != server_port:
+                continue
+            ip = packet[IP]
+            if from_server:
+                flow = (ip.dst, udp.dport, ip.src, udp.sport)
+            else:
+                flow = (ip.src, udp.sport, ip.dst, udp.dport)
+            yield float(packet.time), bytes(udp.payload), flow, from_server
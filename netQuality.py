@@ -0,0 +1,183 @@
+import math
+from collections import OrderedDict
+from typing import Union, Any, Dict, List
+
+# Network quality estimates from the Hazel reliability layer
+#
+# ReliableData and Ping packets carry a sequence number that the other side acknowledges with an Ack of the same
+# seq. Matching the two with capture timestamps gives round trip times, a seq sent twice is a retransmission and a
+# send whose ring slot is reused before it was acknowledged is counted as lost.
+#
+# Memory per flow is constant: pending sends live in a fixed ring indexed by seq and RTT quantiles come from a
+# log bucketed sketch with a bounded number of buckets.
+#
+# Client and server number their packets independently, so packets without a known direction cannot be matched and
+# are only counted as untracked.
+
+RING_SIZE = 256  # Must be a power of two
+MAX_FLOWS = 1024
+
+
+class QuantileSketch:  # Relative error quantiles over positive values, buckets grow geometrically
+    def __init__(self, relative_accuracy=0.02, max_buckets=512):
+        self.gamma: float = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.logGamma: float = math.log(self.gamma)
+        self.maxBuckets: int = max_buckets
+        self.buckets: Dict[int, int] = {}
+        self.count: int = 0
+        self.zeros: int = 0  # Values too small to bucket
+
+    def add(self, value):
+        self.count += 1
+        if value <= 1e-9:
+            self.zeros += 1
+            return
+        key = math.ceil(math.log(value) / self.logGamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        if len(self.buckets) > self.maxBuckets:  # Fold the two lowest buckets, only ever costs accuracy at the bottom
+            lowest, second = sorted(self.buckets)[:2]
+            self.buckets[second] += self.buckets.pop(lowest)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)  # Midpoint of the bucket
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class _SendRing:  # Pending reliable sends of one direction, slot = seq modulo the ring size
+    def __init__(self, size):
+        self.mask: int = size - 1
+        self.seq: List[int] = [-1] * size
+        self.time: List[Any] = [0.0] * size
+        self.retransmitted: List[bool] = [False] * size
+
+
+class FlowStats:
+    def __init__(self, ring_size=RING_SIZE):
+        self.ringSize: int = ring_size
+        self.rings: Dict[Any, _SendRing] = {}  # Sender direction -> pending sends
+        self.rtt: QuantileSketch = QuantileSketch()
+
+        self.sends: int = 0
+        self.pings: int = 0
+        self.retransmits: int = 0
+        self.acks: int = 0
+        self.acked: int = 0
+        self.unmatchedAcks: int = 0
+        self.lost: int = 0
+
+        self.rttMin: Union[bool, Any] = False
+        self.rttMax: Union[bool, Any] = False
+        self.rttSum: float = 0.0
+        self.srtt: Union[bool, Any] = False  # Smoothed RTT, same weighting as TCP
+        self.lastSeen: Any = 0
+
+    def _ring(self, direction):
+        ring = self.rings.get(direction)
+        if ring is None:
+            ring = self.rings[direction] = _SendRing(self.ringSize)
+        return ring
+
+    def sent(self, direction, seq, ts, ping=False):
+        self.lastSeen = ts
+        self.sends += 1
+        if ping:
+            self.pings += 1
+        ring = self._ring(direction)
+        slot = seq & ring.mask
+        if ring.seq[slot] == seq:
+            self.retransmits += 1
+            ring.retransmitted[slot] = True  # RTT of a retransmitted seq is ambiguous, it will not be sampled
+            return
+        if ring.seq[slot] != -1:
+            self.lost += 1  # Slot reused before its ack arrived
+        ring.seq[slot] = seq
+        ring.time[slot] = ts
+        ring.retransmitted[slot] = False
+
+    def ack(self, direction, seq, ts):  # direction is the side sending the ack
+        self.lastSeen = ts
+        self.acks += 1
+        ring = self._ring(not direction)
+        slot = seq & ring.mask
+        if ring.seq[slot] != seq:
+            self.unmatchedAcks += 1  # Duplicate ack, or its send is outside the capture
+            return
+        ring.seq[slot] = -1
+        self.acked += 1
+        if not ring.retransmitted[slot]:
+            self.sample(float(ts - ring.time[slot]))
+
+    def sample(self, rtt):
+        if rtt < 0:
+            return
+        self.rtt.add(rtt)
+        self.rttSum += rtt
+        self.rttMin = rtt if self.rttMin is False else min(self.rttMin, rtt)
+        self.rttMax = rtt if self.rttMax is False else max(self.rttMax, rtt)
+        self.srtt = rtt if self.srtt is False else self.srtt + (rtt - self.srtt) / 8
+
+    def stats(self):
+        samples = self.rtt.count
+        unique_sends = self.sends - self.retransmits
+        return {
+            'sends': self.sends,
+            'pings': self.pings,
+            'acks': self.acks,
+            'acked': self.acked,
+            'unmatchedAcks': self.unmatchedAcks,
+            'retransmits': self.retransmits,
+            'retransmitRate': self.retransmits / self.sends if self.sends else 0.0,
+            'lost': self.lost,
+            'lossRate': self.lost / unique_sends if unique_sends else 0.0,
+            'rttSamples': samples,
+            'rttMin': self.rttMin if samples else None,
+            'rttMean': self.rttSum / samples if samples else None,
+            'srtt': self.srtt if samples else None,
+            'rttP50': self.rtt.quantile(0.5),
+            'rttP90': self.rtt.quantile(0.9),
+            'rttP99': self.rtt.quantile(0.99),
+            'rttMax': self.rttMax if samples else None,
+        }
+
+
+class NetworkTracker:
+    def __init__(self, max_flows=MAX_FLOWS, ring_size=RING_SIZE):
+        self.maxFlows: int = max_flows
+        self.ringSize: int = ring_size
+        self.flows: OrderedDict = OrderedDict()  # Flow key -> FlowStats, least recently seen first
+        self.untracked: int = 0  # Hazel packets seen without a direction
+
+    def flow(self, key):
+        stats = self.flows.get(key)
+        if stats is None:
+            stats = self.flows[key] = FlowStats(self.ringSize)
+            if len(self.flows) > self.maxFlows:
+                self.flows.popitem(last=False)
+        else:
+            self.flows.move_to_end(key)
+        return stats
+
+    def observe(self, flow, from_server, command_name, props, ts):  # Hazel command leaf seen in a packet
+        if from_server is None:
+            self.untracked += 1
+            return
+        if command_name == "ReliableData":
+            self.flow(flow).sent(from_server, props.seq, ts)
+        elif command_name == "Ping":
+            self.flow(flow).sent(from_server, props.seq, ts, ping=True)
+        elif command_name == "Ack":
+            self.flow(flow).ack(from_server, props.seq, ts)
+
+    def stats(self, flow=None):  # Stats of one flow, or of every flow keyed by flow
+        if flow is not None:
+            return self.flows[flow].stats() if flow in self.flows else None
+        return {key: stats.stats() for key, stats in self.flows.items()}
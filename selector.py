@@ -0,0 +1,58 @@
+from collections import namedtuple
+from functools import lru_cache
+
+# Path selectors over parse trees
+#
+# A path is a chain of layer name / command name pairs separated by slashes, outermost first:
+#
+#	"GameData/RpcCall/RPC/MurderPlayer"	MurderPlayer RPCs, sent through a GameData RpcCall
+#	"RPC/*"					any RPC command
+#	"InnerNet/GameData/GameData"		a trailing layer name on its own matches any command on that layer
+#
+# Paths are anchored on the last pair and do not need to start at the Hazil root.
+# A match is a Selection holding the command leaf, the chain of command leaves the path matched (outermost first)
+# and the props of that chain keyed by layer name.
+
+Selection = namedtuple('Selection', ['leaf', 'path', 'props'])
+
+WILDCARD = '*'
+
+
+@lru_cache(maxsize=256)
+def compile_selector(path):  # ((layer, command), ...) innermost first, ready to be walked up from a leaf
+    parts = [part for part in path.split('/') if part]
+    if not parts:
+        raise ValueError("Empty selector")
+    if len(parts) % 2:
+        parts.append(WILDCARD)
+    pairs = [(parts[i], parts[i + 1]) for i in range(0, len(parts), 2)]
+    return tuple(reversed(pairs))
+
+
+def _matches(pattern, value):
+    return pattern == WILDCARD or pattern == value
+
+
+def select(root, path):
+    pairs = compile_selector(path)
+    index = root.index()
+    layer, command = pairs[0]
+    if layer != WILDCARD and command != WILDCARD:
+        candidates = index.get((layer, command), [])
+    else:
+        candidates = [leaf for (leaf_layer, leaf_command), leaves in index.items()
+                      if _matches(layer, leaf_layer) and _matches(command, leaf_command) for leaf in leaves]
+
+    selections = []
+    for leaf in candidates:
+        chain = [leaf]
+        node = leaf
+        for layer, command in pairs[1:]:
+            node = node.parentCommand()
+            if node is None or not _matches(layer, node.parent.name) or not _matches(command, node.commandName):
+                break
+            chain.append(node)
+        else:
+            chain.reverse()
+            selections.append(Selection(leaf, chain, {node.parent.name: node.props for node in chain}))
+    return selections
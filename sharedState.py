@@ -0,0 +1,205 @@
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+from typing import Union, Any, Dict, List
+
+# Shared memory export of the live game state
+#
+# The table has a fixed layout so readers in other processes can decode it without any serialisation:
+#
+#	header	magic, layout version, slot count
+#	seq	seqlock counter, odd while the writer is mid update
+#	state	tick, time, gameId, gameHasStarted
+#	rows	one fixed size row per player slot
+#
+# The writer bumps seq to an odd value, writes, then bumps it to the next even value.
+# Readers copy the table and retry if seq changed or was odd, so they never take a lock.
+
+MAGIC = b'AUGS'
+VERSION = 1
+DEFAULT_SLOTS = 16
+
+_HEADER = struct.Struct('<4sHH')
+_SEQ = struct.Struct('<I')
+_STATE = struct.Struct('<QdIB3x')
+_ROW = struct.Struct('<BBBBIhhHHHff32p6x')  # used, alive, infected, inVent, clientId, playerId, color, skin, hat, pet, x, y, name
+
+_SEQ_OFFSET = _HEADER.size
+_STATE_OFFSET = _SEQ_OFFSET + 8
+_ROWS_OFFSET = _STATE_OFFSET + _STATE.size
+
+PlayerRow = namedtuple('PlayerRow', ['clientId', 'playerId', 'name', 'color', 'skin', 'hat', 'pet',
+                                     'alive', 'infected', 'inVent', 'x', 'y'])
+TableSnapshot = namedtuple('TableSnapshot', ['seq', 'tick', 'time', 'gameId', 'gameHasStarted', 'players'])
+
+_EMPTY_ROW = _ROW.pack(0, 0, 0, 0, 0, -1, -1, 0, 0, 0, 0.0, 0.0, b'')
+
+
+def table_size(slots):
+    return _ROWS_OFFSET + _ROW.size * slots
+
+
+def _open_shared_memory(name):  # Readers must not unlink the writers block when they exit
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # track was only added in python 3.13, attach and take the block back off the tracker
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':  # Windows frees the block with its last handle, there is no tracker to undo
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class _Backing:
+    def __init__(self, name=None, path=None, size=0, create=False):
+        self.shm = None
+        self.mmap = None
+        self.file = None
+        if path is not None:
+            if create:
+                self.file = open(path, 'w+b')
+                self.file.truncate(size)
+                self.mmap = mmap.mmap(self.file.fileno(), 0)
+            else:
+                self.file = open(path, 'rb')
+                self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.buf = memoryview(self.mmap)
+        else:
+            if create:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            else:
+                self.shm = _open_shared_memory(name)
+            self.buf = self.shm.buf
+        self.name = self.shm.name if self.shm else path
+
+    def close(self, unlink=False):
+        if self.mmap:
+            self.buf.release()  # mmap refuses to close while views are exported
+        self.buf = None
+        if self.shm:
+            self.shm.close()
+            if unlink:
+                self.shm.unlink()
+        if self.mmap:
+            self.mmap.close()
+            self.file.close()
+            if unlink:
+                os.remove(self.name)
+
+
+class SharedStateExporter:
+    def __init__(self, engine=None, name=None, path=None, slots=DEFAULT_SLOTS):
+        self.slots: int = slots
+        self.backing: _Backing = _Backing(name, path, table_size(slots), create=True)
+        self.buf = self.backing.buf
+        self.name: str = self.backing.name  # Pass this to SharedStateReader
+
+        self.seq: int = 0
+        self.slotMap: Dict[Any, int] = {}  # clientId -> slot
+        self.freeSlots: List[int] = list(range(slots - 1, -1, -1))
+        self.rowCache: List[Union[bool, Any]] = [False] * slots  # Last packed row per slot, rows are only written on change
+        self.dropped: int = 0  # Players seen without a free slot
+
+        _HEADER.pack_into(self.buf, 0, MAGIC, VERSION, slots)
+        _SEQ.pack_into(self.buf, _SEQ_OFFSET, self.seq)
+        for slot in range(slots):
+            self.buf[self._row_offset(slot):self._row_offset(slot) + _ROW.size] = _EMPTY_ROW
+
+        self.engine = None
+        if engine is not None:
+            self.attach(engine)
+
+    def attach(self, engine):
+        self.engine = engine
+        engine.add_proc_listener(self.update)
+        self.update(engine)
+
+    def detach(self):
+        if self.engine is not None:
+            self.engine.remove_proc_listener(self.update)
+            self.engine = None
+
+    def close(self, unlink=True):
+        self.detach()
+        self.buf = None
+        self.backing.close(unlink)
+
+    @staticmethod
+    def _row_offset(slot):
+        return _ROWS_OFFSET + _ROW.size * slot
+
+    @staticmethod
+    def _pack_player(player):
+        name = player.name if player.name else b''
+        if isinstance(name, str):
+            name = name.encode()
+        color = player.color if player.color is not False else -1
+        return _ROW.pack(1, player.alive, player.infected, player.in_vent, player.clientId & 0xffffffff,
+                         player.playerId, color, player.skin, player.hat, player.pet,
+                         player.x, player.y, name)
+
+    def update(self, engine):  # Proc listener, writes the current engine state into the table
+        rows = {}
+        for client_id, player in engine.players.items():
+            if client_id not in self.slotMap:
+                if not self.freeSlots:
+                    self.dropped += 1
+                    continue
+                self.slotMap[client_id] = self.freeSlots.pop()
+            rows[self.slotMap[client_id]] = self._pack_player(player)
+
+        for client_id in [c for c in self.slotMap if c not in engine.players]:  # Removed players free their slot
+            slot = self.slotMap.pop(client_id)
+            self.freeSlots.append(slot)
+            rows[slot] = _EMPTY_ROW
+
+        changed = [(slot, row) for slot, row in rows.items() if self.rowCache[slot] != row]
+        game_id = engine.gameId if engine.gameId else 0
+
+        self.seq += 1  # Odd, readers will retry
+        _SEQ.pack_into(self.buf, _SEQ_OFFSET, self.seq & 0xffffffff)
+        _STATE.pack_into(self.buf, _STATE_OFFSET, engine.tick, float(engine.time), game_id,
+                         bool(engine.gameHasStarted))
+        for slot, row in changed:
+            offset = self._row_offset(slot)
+            self.buf[offset:offset + _ROW.size] = row
+            self.rowCache[slot] = row
+        self.seq += 1  # Even, table is consistent again
+        _SEQ.pack_into(self.buf, _SEQ_OFFSET, self.seq & 0xffffffff)
+
+
+class SharedStateReader:
+    def __init__(self, name=None, path=None):
+        self.backing: _Backing = _Backing(name, path)
+        self.buf = self.backing.buf
+        magic, version, self.slots = _HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("Not a game state table (magic %r version %d)" % (magic, version))
+        self.size: int = table_size(self.slots)
+
+    def close(self):
+        self.buf = None
+        self.backing.close()
+
+    def snapshot(self):  # Lock free consistent copy of the table, retries while the writer is mid update
+        while True:
+            seq = _SEQ.unpack_from(self.buf, _SEQ_OFFSET)[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            data = bytes(self.buf[:self.size])
+            if _SEQ.unpack_from(self.buf, _SEQ_OFFSET)[0] == seq:
+                break
+
+        tick, ts, game_id, started = _STATE.unpack_from(data, _STATE_OFFSET)
+        players = []
+        for offset in range(_ROWS_OFFSET, self.size, _ROW.size):
+            used, alive, infected, in_vent, client_id, player_id, color, skin, hat, pet, x, y, name = \
+                _ROW.unpack_from(data, offset)
+            if used:
+                players.append(PlayerRow(client_id, player_id, name, color, skin, hat, pet,
+                                         bool(alive), bool(infected), bool(in_vent), x, y))
+        return TableSnapshot(seq, tick, ts, game_id, bool(started), players)
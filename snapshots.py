@@ -0,0 +1,84 @@
+from collections import namedtuple
+from types import MappingProxyType
+from typing import Union, Any, Dict
+
+# Immutable views of GameEngine state for other threads
+#
+# A SnapshotPublisher is registered as a proc listener so a snapshot is only taken once a whole packet has been
+# applied, readers never see a player killed before the Murder callback for that packet has run.
+# Publishing swaps a single reference, readers just grab publisher.latest and never need a lock.
+# Player records that did not change since the last publish are reused, so unchanged parts of consecutive
+# snapshots are the very same objects.
+
+PlayerSnapshot = namedtuple('PlayerSnapshot', ['clientId', 'playerId', 'name', 'color', 'skin', 'hat', 'pet',
+                                               'alive', 'infected', 'inVent', 'x', 'y',
+                                               'playerControlNetId', 'playerPhysicsNetId', 'networkTransformNetId'])
+
+EngineSnapshot = namedtuple('EngineSnapshot', ['tick', 'time', 'gameId', 'selfClientID', 'hostClientID',
+                                               'gameHasStarted', 'meetingStartedBy', 'meetingStartedAt',
+                                               'meetingReason', 'gameSettings', 'players', 'playersById'])
+
+_EMPTY = MappingProxyType({})
+
+
+def player_snapshot(player):
+    return PlayerSnapshot(player.clientId, player.playerId, player.name, player.color, player.skin, player.hat,
+                          player.pet, player.alive, player.infected, player.in_vent, player.x, player.y,
+                          player.playerControlNetId, player.playerPhysicsNetId, player.networkTransformNetId)
+
+
+class SnapshotPublisher:
+    def __init__(self, engine=None):
+        self.latest: Union[bool, EngineSnapshot] = False  # Most recently published snapshot
+        self.published: int = 0
+
+        self.playerCache: Dict[Any, PlayerSnapshot] = {}
+        self.players = _EMPTY
+        self.playersById = _EMPTY
+        self.settingsSource: Union[bool, Any] = False  # gameSettings props the cached proxy was built from
+        self.gameSettings = _EMPTY
+
+        self.engine = None
+        if engine is not None:
+            self.attach(engine)
+
+    def attach(self, engine):
+        self.engine = engine
+        engine.add_proc_listener(self.publish)
+        self.publish(engine)
+
+    def detach(self):
+        if self.engine is not None:
+            self.engine.remove_proc_listener(self.publish)
+            self.engine = None
+
+    def publish(self, engine):  # Proc listener, builds and swaps in a new snapshot
+        cache = {}
+        changed = len(engine.players) != len(self.playerCache)
+        for client_id, player in engine.players.items():
+            record = player_snapshot(player)
+            previous = self.playerCache.get(client_id)
+            if previous == record:
+                record = previous  # Share the unchanged record with the previous snapshot
+            else:
+                changed = True
+            cache[client_id] = record
+
+        if changed:
+            self.playerCache = cache
+            self.players = MappingProxyType(cache)
+            self.playersById = MappingProxyType({record.playerId: record for record in cache.values()
+                                                 if record.playerId != -1})
+
+        if engine.gameSettings is not self.settingsSource:  # Settings are replaced wholesale, never edited
+            self.settingsSource = engine.gameSettings
+            self.gameSettings = MappingProxyType(dict(engine.gameSettings)) if engine.gameSettings else _EMPTY
+
+        started_by = engine.meetingStartedBy.clientId if engine.meetingStartedBy else False
+
+        self.latest = EngineSnapshot(engine.tick, engine.time, engine.gameId, engine.selfClientID,
+                                     engine.hostClientID, engine.gameHasStarted, started_by,
+                                     engine.meetingStartedAt, engine.meetingReason, self.gameSettings,
+                                     self.players, self.playersById)
+        self.published += 1
+        return self.latest
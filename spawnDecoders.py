@@ -0,0 +1,184 @@
+import struct
+from collections import namedtuple
+
+from .helpers import unpackFrom
+
+# Decoders for the raw data blobs carried by spawn subcommands
+#
+# spawnSubcommandLayer leaves each component's state as an undecoded |? blob because its layout depends on the
+# spawned object. These decoders read the blobs at offsets with unpack_from instead of re-slicing the buffer.
+#
+# Ship systems are only mapped for The Skeld (ShipStatus and AprilShipStatus), other maps decode to None.
+
+PlayerControlSpawn = namedtuple('PlayerControlSpawn', ['isNew', 'playerId'])
+GameDataPlayer = namedtuple('GameDataPlayer', ['playerId', 'name', 'colorId', 'hatId', 'petId', 'skinId', 'flags',
+                                               'tasks'])
+VoteState = namedtuple('VoteState', ['votedFor', 'isDead', 'didVote', 'didReport'])
+
+_BB = struct.Struct('<BB')
+_BBBBB = struct.Struct('<BBBBB')
+_FLOAT = struct.Struct('<f')
+
+# SystemTypes ids as used for the ShipStatus dirty bits
+REACTOR = 3
+ELECTRICAL = 7
+LIFE_SUPP = 8
+MED_BAY = 10
+SECURITY = 11
+COMMS = 14
+DOORS = 16
+SABOTAGE = 17
+
+SYSTEM_NAMES = {
+    REACTOR: 'Reactor',
+    ELECTRICAL: 'Electrical',
+    LIFE_SUPP: 'LifeSupp',
+    MED_BAY: 'MedBay',
+    SECURITY: 'Security',
+    COMMS: 'Comms',
+    DOORS: 'Doors',
+    SABOTAGE: 'Sabotage',
+}
+
+SKELD_DOOR_COUNT = 13
+
+
+def read_string(data, offset):  # 1 byte length followed by that many bytes, the |s structure
+    length = data[offset]
+    offset += 1
+    return bytes(data[offset:offset + length]), offset + length
+
+
+def decode_player_control(data):
+    return PlayerControlSpawn(*_BB.unpack_from(data, 0))
+
+
+def decode_game_data_players(data):  # Player list sent with the GameData spawn, same fields as UpdateGameData
+    players = []
+    count = data[0]
+    offset = 1
+    for i in range(count):
+        player_id = data[offset]
+        name, offset = read_string(data, offset + 1)
+        color_id, hat_id, pet_id, skin_id, flags = _BBBBB.unpack_from(data, offset)
+        offset += _BBBBB.size
+        task_count = data[offset]
+        offset += 1
+        tasks = []
+        for t in range(task_count):
+            task, offset = unpackFrom(data, offset)
+            tasks.append(task)
+        players.append(GameDataPlayer(player_id, name, color_id, hat_id, pet_id, skin_id, flags, tasks))
+    return players
+
+
+def decode_vote_state(b):
+    return VoteState((b & 15) - 1, bool(b & 128), bool(b & 64), bool(b & 32))
+
+
+def decode_meeting_hud(data):  # Initial state, one vote area byte per player
+    return tuple(decode_vote_state(b) for b in data)
+
+
+#
+# Ship systems, each decoder returns the system state and the offset after it
+# previous is the last known state, only needed by systems that send partial updates
+#
+
+def _decode_reactor(data, offset, initial, previous):
+    countdown = _FLOAT.unpack_from(data, offset)[0]
+    count, offset = unpackFrom(data, offset + 4)
+    pairs = tuple(_BB.unpack_from(data, offset + i * 2) for i in range(count))  # (player id, console id)
+    return {'countdown': countdown, 'userConsolePairs': pairs}, offset + count * 2
+
+
+def _decode_switches(data, offset, initial, previous):
+    expected, actual, value = data[offset], data[offset + 1], data[offset + 2]
+    return {'expectedSwitches': expected, 'actualSwitches': actual, 'value': value}, offset + 3
+
+
+def _decode_life_supp(data, offset, initial, previous):
+    countdown = _FLOAT.unpack_from(data, offset)[0]
+    count, offset = unpackFrom(data, offset + 4)
+    consoles = []
+    for i in range(count):
+        console, offset = unpackFrom(data, offset)
+        consoles.append(console)
+    return {'countdown': countdown, 'completedConsoles': tuple(consoles)}, offset
+
+
+def _decode_med_scan(data, offset, initial, previous):
+    count, offset = unpackFrom(data, offset)
+    return {'users': tuple(data[offset:offset + count])}, offset + count
+
+
+def _decode_security(data, offset, initial, previous):
+    count = data[offset]
+    offset += 1
+    return {'users': tuple(data[offset:offset + count])}, offset + count
+
+
+def _decode_hud_override(data, offset, initial, previous):
+    return {'active': bool(data[offset])}, offset + 1
+
+
+def _decode_doors(data, offset, initial, previous):
+    if initial:
+        doors = tuple(bool(b) for b in data[offset:offset + SKELD_DOOR_COUNT])
+        return {'doors': doors}, offset + SKELD_DOOR_COUNT
+    dirty, offset = unpackFrom(data, offset)
+    doors = list(previous['doors'] if previous else [False] * SKELD_DOOR_COUNT)
+    for door in range(SKELD_DOOR_COUNT):
+        if dirty & (1 << door):
+            doors[door] = bool(data[offset])
+            offset += 1
+    return {'doors': tuple(doors)}, offset
+
+
+def _decode_sabotage(data, offset, initial, previous):
+    return {'timer': _FLOAT.unpack_from(data, offset)[0]}, offset + 4
+
+
+# Systems present on a map, in the order ShipStatus serialises them (ascending SystemTypes id)
+SKELD_SYSTEMS = [
+    (REACTOR, _decode_reactor),
+    (ELECTRICAL, _decode_switches),
+    (LIFE_SUPP, _decode_life_supp),
+    (MED_BAY, _decode_med_scan),
+    (SECURITY, _decode_security),
+    (COMMS, _decode_hud_override),
+    (DOORS, _decode_doors),
+    (SABOTAGE, _decode_sabotage),
+]
+
+SHIP_LAYOUTS = {
+    'ShipStatus': SKELD_SYSTEMS,
+    'AprilShipStatus': SKELD_SYSTEMS,  # Mirrored Skeld, same systems
+}
+
+
+def decode_ship_status(spawn_name, data):  # Initial state of every system, keyed by system name
+    layout = SHIP_LAYOUTS.get(spawn_name)
+    if layout is None:
+        return None
+    systems = {}
+    offset = 0
+    for system_type, decoder in layout:
+        systems[SYSTEM_NAMES[system_type]], offset = decoder(data, offset, True, None)
+    return systems
+
+
+SPAWN_DECODERS = {
+    'Player': lambda blobs: decode_player_control(blobs[0]),
+    'GameData': lambda blobs: decode_game_data_players(blobs[0]),
+    'MeetingHud': lambda blobs: decode_meeting_hud(blobs[0]),
+    'ShipStatus': lambda blobs: decode_ship_status('ShipStatus', blobs[0]),
+    'AprilShipStatus': lambda blobs: decode_ship_status('AprilShipStatus', blobs[0]),
+}
+
+
+def decode_spawn(spawn_name, blobs):  # blobs are the data props of the spawn subcommands, in order
+    decoder = SPAWN_DECODERS.get(spawn_name)
+    if decoder is None or not blobs:
+        return None
+    return decoder(blobs)
@@ -0,0 +1,70 @@
+import struct
+from collections import namedtuple
+from typing import Any, Dict, List
+
+from .helpers import unpackFrom
+from .spawnDecoders import SHIP_LAYOUTS, SYSTEM_NAMES, decode_ship_status, decode_meeting_hud, decode_vote_state
+
+# Live state of the ShipStatus and MeetingHud objects
+#
+# Both objects send their full state once when spawned, afterwards every GameData Data message addressed to them
+# starts with a packed dirty bit mask and only carries the systems / vote areas whose bit is set.
+# apply() decodes only those parts and returns the individual fields that actually changed.
+# Blobs from other game versions or unknown maps raise one of DECODE_ERRORS, the state is not to be trusted after.
+
+SystemChange = namedtuple('SystemChange', ['system', 'field', 'previous', 'value'])
+VoteChange = namedtuple('VoteChange', ['index', 'playerId', 'previous', 'value'])
+
+DECODE_ERRORS = (struct.error, IndexError)
+
+
+class ShipStatusState:
+    def __init__(self, net_id, spawn_name, data):
+        self.netId = net_id
+        self.spawnName: str = spawn_name
+        self.layout: List[Any] = SHIP_LAYOUTS[spawn_name]
+        self.systems: Dict[str, Dict] = decode_ship_status(spawn_name, data)
+
+    def apply(self, data):
+        changes = []
+        dirty, offset = unpackFrom(data, 0)
+        for system_type, decoder in self.layout:
+            if not dirty & (1 << system_type):
+                continue
+            name = SYSTEM_NAMES[system_type]
+            previous = self.systems.get(name)
+            state, offset = decoder(data, offset, False, previous)
+            for field, value in state.items():
+                old = previous.get(field) if previous else None
+                if old != value:
+                    changes.append(SystemChange(name, field, old, value))
+            self.systems[name] = state
+        return changes
+
+
+class MeetingHudState:
+    def __init__(self, net_id, data, player_ids):
+        self.netId = net_id
+        self.playerIds: List[int] = player_ids  # Player id of each vote area, vote areas are in ascending id order
+        self.votes: List[Any] = list(decode_meeting_hud(data))
+
+    def player_id(self, index):
+        return self.playerIds[index] if index < len(self.playerIds) else None
+
+    def apply(self, data):
+        changes = []
+        dirty, offset = unpackFrom(data, 0)
+        index = 0
+        while dirty:
+            if dirty & 1:
+                value = decode_vote_state(data[offset])
+                offset += 1
+                while index >= len(self.votes):
+                    self.votes.append(None)
+                previous = self.votes[index]
+                if previous != value:
+                    self.votes[index] = value
+                    changes.append(VoteChange(index, self.player_id(index), previous, value))
+            dirty >>= 1
+            index += 1
+        return changes
@@ -0,0 +1,46 @@
+import importlib
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(ROOT)
+sys.path.insert(0, os.path.dirname(ROOT))
+entityPreload = importlib.import_module(PACKAGE + '.entityPreload')
+
+
+def held(buffer):
+    return {net_id: [record.time for record in records] for net_id, records in buffer.entities.items()}
+
+
+class EntityPreloadBufferTest(unittest.TestCase):
+    def test_expiry_follows_record_age_across_entities(self):
+        buffer = entityPreload.EntityPreloadBuffer(max_age=100)
+        buffer.add('A', 0, 'SetName', {})
+        buffer.add('B', 10, 'SetName', {})
+        buffer.add('A', 95, 'SetColor', {})
+        buffer.add('C', 150, 'SetName', {})  # B@10 is stale even though A was buffered first
+        self.assertEqual(held(buffer), {'A': [95], 'C': [150]})
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(buffer.evictions, 2)
+
+    def test_taken_records_do_not_cost_fresh_ones(self):
+        buffer = entityPreload.EntityPreloadBuffer(max_age=100)
+        buffer.add(1, 0, 'SetName', {})
+        self.assertEqual(len(buffer.take(1)), 1)
+        buffer.add(2, 500, 'SetName', {})
+        buffer.add(3, 500, 'SetName', {})
+        self.assertEqual(held(buffer), {2: [500], 3: [500]})
+        self.assertEqual(buffer.evictions, 0)
+
+    def test_total_limit_evicts_the_oldest_record(self):
+        buffer = entityPreload.EntityPreloadBuffer(max_total=2, max_age=None)
+        buffer.add('A', 0, 'SetName', {})
+        buffer.add('B', 10, 'SetName', {})
+        buffer.add('A', 95, 'SetColor', {})
+        self.assertEqual(held(buffer), {'A': [95], 'B': [10]})
+        self.assertEqual(buffer.evictions, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
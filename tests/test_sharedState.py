@@ -0,0 +1,37 @@
+import importlib
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(ROOT)
+sys.path.insert(0, os.path.dirname(ROOT))
+sharedState = importlib.import_module(PACKAGE + '.sharedState')
+
+READER = """
+import sys
+sys.path.insert(0, %r)
+from %s.sharedState import SharedStateReader
+reader = SharedStateReader(sys.argv[1])
+print(reader.snapshot().tick)
+reader.close()
+"""
+
+
+class SharedMemoryReaderTest(unittest.TestCase):
+    def test_reader_processes_do_not_unlink_the_table(self):
+        exporter = sharedState.SharedStateExporter()
+        try:
+            script = READER % (os.path.dirname(ROOT), PACKAGE)
+            for _ in range(2):  # The second reader fails if the first one's exit unlinked the block
+                result = subprocess.run([sys.executable, '-c', script, exporter.name],
+                                        capture_output=True, text=True, timeout=60)
+                self.assertEqual(result.returncode, 0, result.stderr)
+                self.assertEqual(result.stdout.strip(), '0')
+        finally:
+            exporter.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
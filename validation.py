@@ -0,0 +1,163 @@
+import struct
+from collections import namedtuple
+
+from . import parse, instrumentation
+from .layers import hazilLayer
+
+# Cheap framing checks run before a packet is parsed
+#
+# parse() finds junk by decoding until an unpack fails, which on a shared port means a partial tree and an exception
+# per foreign datagram. check() only reads the bytes that decide whether the framing holds up:
+#
+#	the Hazil command byte and the fixed fields of that command
+#	every size field against the bytes actually left in the packet or the enclosing message: <H InnerNet messages,
+#	<H GameData messages inside GameData / GameDataTo, <B GameSettings messages of SyncSettings, <H UpdateGameData
+#	messages, and the netId + <H SpawnSubcommand messages of a Spawn
+#
+# Nothing is allocated for a packet that passes. A packet that fails comes back as a Rejection naming the layer, a
+# reason code and the offset it was found at, and is counted per (layer, reason).
+
+Rejection = namedtuple('Rejection', ['layer', 'reason', 'offset'])
+
+EMPTY = 'Empty'
+UNKNOWN_COMMAND = 'UnknownCommand'
+TRUNCATED = 'Truncated'  # Fewer bytes than the fixed fields or the size header need
+SIZE_OVERRUN = 'SizeOverrun'  # Size field points past the end of the packet or enclosing message
+BAD_PACKED_INT = 'BadPackedInt'
+
+SIZE_FIELDS = {  # Layer -> struct of the size header in front of each message
+    'InnerNet': struct.Struct('<H'),
+    'GameData': struct.Struct('<H'),
+    'GameSettings': struct.Struct('<B'),
+    'UpdateGameData': struct.Struct('<H'),
+}
+
+
+def _hazil_minimums():  # Hazil command byte -> bytes needed for the command byte and its fixed fields
+    layer = hazilLayer(None)
+    minimums = {}
+    for commandId, structure, argNames, childHandler in layer.commands().values():
+        fixed = structure.split('|')[0] if structure else ''
+        string = 1 if structure and '|s' in structure else 0  # Length byte of a trailing string
+        minimums[commandId] = 1 + struct.calcsize(layer.order + fixed) + string
+    return minimums
+
+
+HAZIL_MINIMUMS = _hazil_minimums()
+HAZIL_PAYLOAD_OFFSETS = {0: 1, 1: 3}  # UnreliableData / ReliableData, where the InnerNet messages start
+GAME_DATA_COMMANDS = {5: 4, 6: 4}  # GameData / GameDataTo, bytes of gameId before the GameData messages
+RPC_CALL, SPAWN = 2, 4  # GameData commands carrying sized messages
+RPC_MESSAGES = {2: 'GameSettings', 30: 'UpdateGameData'}  # SyncSettings / UpdateGameData, messages fill the rest
+
+
+def _skip_packed(data, offset, end):  # Offset after a Hazel packed int (at most 5 bytes), -1 if it runs off the end
+    for stop in range(offset, min(offset + 5, end)):
+        if not data[stop] & 0x80:
+            return stop + 1
+    return -1
+
+
+def _check_spawn(data, offset, end):  # Spawn type, owner, two bytes, then packed netId + <H sized components
+    offset = _skip_packed(data, offset + 1, end)
+    if offset < 0:
+        return Rejection('Spawn', BAD_PACKED_INT, offset)
+    if offset + 2 > end:
+        return Rejection('Spawn', TRUNCATED, offset)
+    offset += 2
+    size_field = SIZE_FIELDS['GameData']
+    while offset < end:
+        body = _skip_packed(data, offset, end)
+        if body < 0:
+            return Rejection('SpawnSubcommand', BAD_PACKED_INT, offset)
+        if end - body < 3:
+            return Rejection('SpawnSubcommand', TRUNCATED, offset)
+        stop = body + 3 + size_field.unpack_from(data, body)[0]
+        if stop > end:
+            return Rejection('SpawnSubcommand', SIZE_OVERRUN, offset)
+        offset = stop
+    return None
+
+
+def _check_nested(data, command, body, stop, layer):  # Sized messages carried inside one message of layer
+    if layer == 'InnerNet' and command in GAME_DATA_COMMANDS:
+        start = body + GAME_DATA_COMMANDS[command]
+        if start > stop:
+            return Rejection(layer, TRUNCATED, body)
+        if command == 6:  # GameDataTo names the target client first
+            start = _skip_packed(data, start, stop)
+            if start < 0:
+                return Rejection(layer, BAD_PACKED_INT, body)
+        return _check_messages(data, start, stop, 'GameData')
+    if layer == 'GameData' and command == RPC_CALL:
+        start = _skip_packed(data, body, stop)
+        if start < 0:
+            return Rejection(layer, BAD_PACKED_INT, body)
+        if start < stop and data[start] in RPC_MESSAGES:
+            return _check_messages(data, start + 1, stop, RPC_MESSAGES[data[start]])
+    if layer == 'GameData' and command == SPAWN and body < stop:
+        return _check_spawn(data, body, stop)
+    return None
+
+
+def _check_messages(data, offset, end, layer):  # Walks the sized messages of layer between offset and end
+    size_field = SIZE_FIELDS[layer]
+    header = size_field.size + 1  # Size does not count the byte after it, the command byte of most layers
+    while offset < end:
+        if end - offset < header:
+            return Rejection(layer, TRUNCATED, offset)
+        body = offset + header
+        stop = body + size_field.unpack_from(data, offset)[0]
+        if stop > end:
+            return Rejection(layer, SIZE_OVERRUN, offset)
+        rejection = _check_nested(data, data[body - 1], body, stop, layer)
+        if rejection is not None:
+            return rejection
+        offset = stop
+    return None
+
+
+def check(data):  # None when the framing holds up, a Rejection otherwise
+    if not data:
+        return Rejection('Hazil', EMPTY, 0)
+    minimum = HAZIL_MINIMUMS.get(data[0])
+    if minimum is None:
+        return Rejection('Hazil', UNKNOWN_COMMAND, 0)
+    if len(data) < minimum:
+        return Rejection('Hazil', TRUNCATED, 0)
+    offset = HAZIL_PAYLOAD_OFFSETS.get(data[0])
+    if offset is None:
+        return None
+    return _check_messages(data, offset, len(data), 'InnerNet')
+
+
+class Validator:
+    def __init__(self):
+        self.checked: int = 0
+        self.rejected: int = 0
+        self.counts = {}  # (layer, reason) -> packets rejected
+        self.lastRejection = None
+
+    def check(self, data):
+        self.checked += 1
+        rejection = check(data)
+        if rejection is not None:
+            self.rejected += 1
+            key = (rejection.layer, rejection.reason)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.lastRejection = rejection
+            stats = instrumentation.collector
+            if stats is not None:
+                stats.record_error(rejection.layer, 'Validation', rejection.reason)
+        return rejection
+
+    def parse(self, data):  # Parse tree of a valid packet, None for a rejected one
+        if self.check(data) is not None:
+            return None
+        return parse(data)
+
+    def snapshot(self):
+        return {
+            'checked': self.checked,
+            'rejected': self.rejected,
+            'reasons': {layer + '/' + reason: count for (layer, reason), count in list(self.counts.items())},
+        }